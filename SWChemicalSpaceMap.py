@@ -3,12 +3,12 @@
 # This file is designed to plot chemical space partitioning maps
 # given: X, Y, and a set of phi values. (usually a set of 3)
 
+import multiprocessing
 import numpy as np
-from pylab import *
 
 class SWChemicalSpaceMap(object):
 	"""docstring for SWChemicalSpaceMap"""
-	def __init__(self, x, y, phi, phase_names):
+	def __init__(self, x, y, phi, phase_names, draw = True):
 		super(SWChemicalSpaceMap, self).__init__()
 		self.y = y
 		self.x = x
@@ -26,18 +26,202 @@ class SWChemicalSpaceMap(object):
 		self.linewidth = 2
 		self.line_levels = (50, 90)
 		self.plot_lines = False
+		self.adaptive = False # contour only the tiles a level crosses, at full resolution
+		self.tile_size = 32 # grid cells per tile side when adaptive
+		self.path_cache = {}
 
 		self.colors = [('aqua', 'deepskyblue'), ('crimson', 'maroon'), ('yellow', 'gold'), ('orange', 'coral')]
 
 		self.check_lengths()
-		self.plot()
+		if draw:
+			self.plot()
 	
+	@classmethod
+	def from_partitioning(cls, x, y, volumes, coefficients, phase_names, chunk_size=None, draw=True):
+		"""map of the phase distribution computed by phase_distribution()"""
+		return cls(x, y, phase_distribution(x, y, volumes, coefficients, chunk_size), phase_names, draw)
+
 	def check_lengths(self):
 			if not len(self.phi) == len(self.phase_names):
 				raise Exception('Error, number of phase names does not match number of phis provided')
 
-	def plot(self):
+	def plot(self, ax = None):
+		# draws into ax, or into the current pyplot axes if no ax is given.
+		if ax is None:
+			import matplotlib.pyplot as plt
+			ax = plt.gca()
+		if self.adaptive:
+			self.plot_adaptive(ax)
+			return
 		for i in range(len(self.phi)):
-			contourf(self.x, self.y, self.phi[i], 8, levels = self.levels, alpha = self.alpha, colors = self.colors[i])
+			ax.contourf(self.x, self.y, self.phi[i], 8, levels = self.levels, alpha = self.alpha, colors = self.colors[i])
 			if self.plot_lines:
-				contour(self.x, self.y, self.phi[i], self.line_levels, alpha = 1.0, colors = self.colors[i][1], linewidths = self.linewidth)
\ No newline at end of file
+				ax.contour(self.x, self.y, self.phi[i], self.line_levels, alpha = 1.0, colors = self.colors[i][1], linewidths = self.linewidth)
+
+	def plot_adaptive(self, ax):
+		# draws the cached contour paths, so restyling does not recompute them.
+		from matplotlib.collections import PathCollection
+		for i in range(len(self.phi)):
+			colors = self.colors[i]
+			for band, paths in enumerate(self.contour_paths(i, self.levels, True)):
+				ax.add_collection(PathCollection(paths, facecolors = colors[band % len(colors)], edgecolors = 'none', linewidths = 0, alpha = self.alpha, antialiaseds = False))
+			if self.plot_lines:
+				for paths in self.contour_paths(i, self.line_levels, False):
+					ax.add_collection(PathCollection(paths, facecolors = 'none', edgecolors = colors[1], linewidths = self.linewidth, alpha = 1.0))
+		ax.set_xlim(self.xmin, self.xmax)
+		ax.set_ylim(self.ymin, self.ymax)
+
+	def contour_paths(self, i, levels, filled):
+		"""paths of phase i, one list per band between levels (filled) or per level, computed once per phi array"""
+		key = (i, tuple(levels), filled, self.tile_size)
+		# phi and its phase are kept next to the paths, assigning a new self.phi (or self.phi[i] of a list)
+		# recomputes them. Changing an array in place does not, clear path_cache then.
+		# Indexing an ndarray gives a new view every time, so only a list is checked per phase.
+		phi, phase, paths = self.path_cache.get(key, (None, None, None))
+		if phi is not self.phi or (not isinstance(self.phi, np.ndarray) and phase is not self.phi[i]):
+			paths = self.compute_contour_paths(self.phi[i], levels, filled)
+			self.path_cache[key] = (self.phi, self.phi[i], paths)
+		return paths
+
+	def compute_contour_paths(self, phi, levels, filled):
+		# Tiles where phi stays inside one band are filled as rectangles of that band,
+		# only the tiles a level crosses are contoured at full resolution.
+		from matplotlib.path import Path
+		x = np.asarray(self.x, dtype = float)
+		y = np.asarray(self.y, dtype = float)
+		phi = np.asarray(phi, dtype = float)
+		levels = list(levels)
+		step = self.tile_size
+		rows = np.arange(0, len(y) - 1, step)
+		columns = np.arange(0, len(x) - 1, step)
+		low = _tile_reduce(_tile_reduce(phi, step, 0, np.minimum), step, 1, np.minimum)
+		high = _tile_reduce(_tile_reduce(phi, step, 0, np.maximum), step, 1, np.maximum)
+		refine = np.isnan(low) | np.isnan(high)
+		for level in levels:
+			refine |= (low <= level) & (level <= high)
+
+		paths = [[] for level in (levels[:-1] if filled else levels)]
+		if filled:
+			band = np.searchsorted(levels, low) - 1
+			for k in range(len(paths)):
+				r, c = np.nonzero(~refine & (band == k))
+				if len(r):
+					paths[k].append(_rectangles(x[columns[c]], x[np.minimum(columns[c] + step, len(x) - 1)], y[rows[r]], y[np.minimum(rows[r] + step, len(y) - 1)]))
+		for r, c in zip(*np.nonzero(refine)):
+			tile_rows = slice(rows[r], rows[r] + step + 1)
+			tile_columns = slice(columns[c], columns[c] + step + 1)
+			tile = np.ma.masked_invalid(phi[tile_rows, tile_columns])
+			if tile.count() == 0:
+				continue
+			for k, segments in enumerate(_tile_contours(x[tile_columns], y[tile_rows], tile, levels, filled)):
+				paths[k].extend(Path(vertices, codes) for vertices, codes in segments)
+		return paths
+
+def _tile_reduce(a, step, axis, ufunc):
+	# ufunc over every tile of step cells along axis, neighbouring tiles share their edge nodes.
+	starts = np.arange(0, a.shape[axis] - 1, step)
+	edges = np.minimum(starts + step, a.shape[axis] - 1)
+	return ufunc(ufunc.reduceat(a, starts, axis = axis), np.take(a, edges, axis = axis))
+
+def _rectangles(x0, x1, y0, y1):
+	# one compound path of the rectangles [x0, x1] x [y0, y1]
+	from matplotlib.path import Path
+	vertices = np.stack([np.stack(corner, axis = -1) for corner in ((x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0))], axis = 1)
+	codes = np.tile([Path.MOVETO, Path.LINETO, Path.LINETO, Path.LINETO, Path.CLOSEPOLY], len(x0))
+	return Path(vertices.reshape(-1, 2), codes)
+
+def _tile_contours(x, y, z, levels, filled):
+	# (vertices, codes) of one tile, a list per band between levels (filled) or per level.
+	# Uses contourpy (matplotlib 3.6 and later) or the generator of older matplotlib.
+	try:
+		import contourpy
+	except ImportError:
+		contourpy = None
+	if contourpy is not None:
+		generator = contourpy.contour_generator(x, y, z, fill_type = 'OuterCode', line_type = 'SeparateCode')
+		if filled:
+			return [list(zip(*generator.filled(lower, upper))) for lower, upper in zip(levels[:-1], levels[1:])]
+		return [list(zip(*generator.lines(level))) for level in levels]
+
+	from matplotlib import _contour, rcParams
+	x, y = np.meshgrid(x, y)
+	mask = np.ma.getmask(z)
+	generator = _contour.QuadContourGenerator(x, y, z.filled(), mask if mask is not np.ma.nomask else None, rcParams['contour.corner_mask'], 0)
+	if filled:
+		return [list(zip(*generator.create_filled_contour(lower, upper))) for lower, upper in zip(levels[:-1], levels[1:])]
+	segments = []
+	for level in levels:
+		lines = generator.create_contour(level)
+		if isinstance(lines, tuple):
+			segments.append(list(zip(*lines)))
+		else:
+			segments.append([(vertices, None) for vertices in lines])
+	return segments
+
+def phase_distribution(x, y, volumes, coefficients, chunk_size=None):
+	"""Percentage of the chemical in each phase over the x/y grid.
+
+	Phase j holds V_j * K_j / sum_k(V_k * K_k) of the chemical, where
+	log10(K_j) = ax * x + ay * y + c for coefficients[j] = (ax, ay, c),
+	e.g. air (1, 0, 0), water (0, 0, 0) and octanol (0, 1, 0) when x is
+	log KAW and y is log KOW. Returns an array of shape (phases, len(y), len(x))
+	that can be passed to SWChemicalSpaceMap as phi.
+	chunk_size limits how many rows of y are computed at once.
+	"""
+	x = np.asarray(x, dtype=float)
+	y = np.asarray(y, dtype=float)
+	volumes = np.asarray(volumes, dtype=float)
+	coefficients = np.asarray(coefficients, dtype=float).reshape(-1, 3)
+	if not len(volumes) == len(coefficients):
+		raise Exception('Error, number of volumes does not match number of partition coefficients provided')
+	if chunk_size is None:
+		chunk_size = len(y)
+	chunk_size = max(int(chunk_size), 1)
+
+	ax = coefficients[:, 0, None, None]
+	ay = coefficients[:, 1, None, None]
+	c = (coefficients[:, 2] + np.log10(volumes))[:, None, None]
+	phi = np.empty((len(volumes), len(y), len(x)))
+	for start in range(0, len(y), chunk_size):
+		rows = y[start:start + chunk_size]
+		# log10(V_j * K_j); subtracting the largest phase keeps 10 ** log_vk from overflowing.
+		log_vk = ax * x[None, None, :] + ay * rows[None, :, None] + c
+		log_vk -= log_vk.max(axis=0)
+		vk = 10.0 ** log_vk
+		phi[:, start:start + len(rows)] = 100.0 * vk / vk.sum(axis=0)
+	return phi
+
+def _render_map(job):
+	# process pool worker for render_maps, draws one map on its own Agg figure.
+	from matplotlib.figure import Figure
+	from matplotlib.backends.backend_agg import FigureCanvasAgg
+	(x, y, phi, phase_names), filename, figsize, dpi, properties = job
+	chemical_space_map = SWChemicalSpaceMap(x, y, phi, phase_names, draw = False)
+	for name, value in properties.items():
+		setattr(chemical_space_map, name, value)
+	figure = Figure(figsize = figsize)
+	FigureCanvasAgg(figure)
+	chemical_space_map.plot(figure.add_subplot(111))
+	figure.savefig(filename, dpi = dpi)
+	return filename
+
+def render_maps(jobs, filenames, processes = None, figsize = (8, 6), dpi = 100, **properties):
+	"""Render many chemical space maps to image files without a display.
+
+	jobs are (x, y, phi, phase_names) tuples, written to the matching filenames
+	(the extension picks the format). Each map is drawn on its own Figure with
+	the Agg backend, in a process pool of size processes (None uses every core).
+	properties (e.g. alpha = 0.5, plot_lines = True) are set on every map.
+	Returns the filenames.
+	"""
+	if not len(jobs) == len(filenames):
+		raise Exception('Error, number of filenames does not match number of maps provided')
+	jobs = [(job, filename, figsize, dpi, properties) for job, filename in zip(jobs, filenames)]
+	if processes == 1 or len(jobs) < 2:
+		return [_render_map(job) for job in jobs]
+	pool = multiprocessing.Pool(processes)
+	try:
+		return pool.map(_render_map, jobs)
+	finally:
+		pool.close()
+		pool.join()
@@ -3,8 +3,16 @@
 # Copyright (c) 2014 Stephen Wood. See included LICENSE file.
 
 import csv
+import glob
+import multiprocessing
+import os
+import struct
+import time
+from collections import OrderedDict
 from operator import itemgetter
+import numpy as np
 import SWSettings as s
+from SWStats import instrumented, measure
 
 class SWHumanConcentrationReader(object):
 	"""docstring for ConcentrationReader 
@@ -16,18 +24,44 @@ class SWHumanConcentrationReader(object):
 
 	ACCEPTED_FILENAMES = ['CMAN', 'CWOMAN', 'seqn']
 	INVALID_YEAR_ENTERED = 'Invalid year entered'
+	NO_HEADER = 'Error, no Time header row found in file %s'
 	TIME_STRING = 'time'
 	MAX_AGE_MODEL_START = 9
 	MIN_AGE_MODEL_START = 0
 
+	# Storage backends for the parsed file.
+	LIST_STORAGE = 'list' # rows kept as lists of strings (original behaviour)
+	ARRAY_STORAGE = 'array' # time + human columns parsed once into a float64 ndarray
+	LAZY_STORAGE = 'lazy' # only byte offsets kept, rows parsed from disk when queried
+	STORAGE_TYPES = [LIST_STORAGE, ARRAY_STORAGE, LAZY_STORAGE]
+
+	# Interpolation used when resampling onto a new time grid.
+	LINEAR_INTERPOLATION = 'linear'
+	STEP_INTERPOLATION = 'step' # last output at or before the requested time
+	INTERPOLATION_TYPES = [LINEAR_INTERPOLATION, STEP_INTERPOLATION]
+
+	# Sidecar binary cache of the parsed array.
+	# header: magic, version, source size, source mtime, start row, rows, columns
+	CACHE_EXTENSION = '.swcache'
+	CACHE_MAGIC = b'SWHC'
+	CACHE_VERSION = 2
+	CACHE_HEADER = struct.Struct('<4sIqdqqq')
+
 	# PUBLIC API
 	# METHODS BELOW
 
-	def __init__(self, filename, startyear=s.DEFAULT_START_YEAR, age_at_model_start=s.DEFAULT_AGE_AT_MODEL_START): # initializer / constructor
+	def __init__(self, filename, startyear=s.DEFAULT_START_YEAR, age_at_model_start=s.DEFAULT_AGE_AT_MODEL_START, storage=None, cache=False, stats=None): # initializer / constructor
+
+		if storage is None: # the cache always holds the parsed array, otherwise rows are kept as lists of strings
+			storage = self.ARRAY_STORAGE if cache else self.LIST_STORAGE
 
 		# error checks
 		if age_at_model_start < self.MIN_AGE_MODEL_START or age_at_model_start > self.MAX_AGE_MODEL_START:
 			raise Exception('Invalid age at model start: %d for file %s' % (age_at_model_start, filename))
+		if storage not in self.STORAGE_TYPES:
+			raise Exception('Invalid storage type: %s for file %s' % (storage, filename))
+		if cache and storage != self.ARRAY_STORAGE:
+			raise Exception('Invalid storage type: the cache holds the parsed array, it can not be used with %s storage for file %s' % (storage, filename))
 
 		super(SWHumanConcentrationReader, self).__init__()
 		self.filename = filename
@@ -35,12 +69,37 @@ class SWHumanConcentrationReader(object):
 		# 	raise IOError, 'Error, invalid human concentration file entered.'
 		self.startyear = startyear
 		self.age_at_model_start = age_at_model_start
-		self.data = self.__read_file(filename)
-		self.endyear = int(self.data[len(self.data) - 1][0]) / s.HOURS_IN_YEAR + self.startyear
+		self.storage = storage
+		self.cache = cache
+		self.stats = stats # SWStats recording the load phases and queries if given
+		if self.storage == self.ARRAY_STORAGE:
+			self.data = self.__open_array(filename, cache)
+		elif self.storage == self.LAZY_STORAGE:
+			with measure(stats, 'SWHumanConcentrationReader.scan') as phase:
+				self.data = SWLazyConcentrationRows(filename, self.TIME_STRING)
+				phase.rows = len(self.data)
+		else:
+			with measure(stats, 'SWHumanConcentrationReader.read_file') as phase:
+				self.data = self.__read_file(filename)
+				phase.rows = len(self.data)
+				phase.cells = sum(len(row) for row in self.data) if stats is not None else 0
+		self.data_start_index = self.__determine_index_at_data_start()
+		self.endyear = self.__determine_endyear()
 		self.timestep = self.__determine_timestep()
-		self.time_step_dict = self.__create_time_step_dict()
-		self.column_dict = self.__create_column_dict()
-
+		with measure(stats, 'SWHumanConcentrationReader.create_time_step_dict') as phase:
+			self.time_step_dict = self.__create_time_step_dict()
+			phase.rows = len(self.time_step_dict)
+		with measure(stats, 'SWHumanConcentrationReader.create_column_dict') as phase:
+			self.column_dict = self.__create_column_dict()
+			phase.rows = len(self.column_dict)
+		self.CBAT_cubes = {} # {step in hours : (years, ages, concentrations)}
+		# refresh() continues from the end of the last complete line, a partial last row is parsed again once complete.
+		self.follow_offset, partial = self.__last_complete_line(filename)
+		# the last data row came from a line still being written, every storage leaves it out unless it is a whole row.
+		self.follow_partial_row = bool(partial.strip()) and _float_row(next(csv.reader([partial])), s.NUMBER_OF_HUMANS + 1) is not None
+		self.__buffer = None # spare rows for array storage to grow into
+
+	@instrumented
 	def concentration_for_individual_at_sampling(self, birth_year, sampling_year):
 		"""Gets the individual's concentration at time of sampling."""
 		if not self.__is_year_in_simulation(sampling_year):
@@ -49,9 +108,38 @@ class SWHumanConcentrationReader(object):
 		index = self.__get_index_for_person_at_sampling(birth_year, sampling_year, c)
 		return c[index]
 
+	@instrumented
+	def concentrations_for_individuals_at_sampling(self, birth_years, sampling_years):
+		"""Gets the concentration at time of sampling for many individuals at once.
+
+		Same rules as concentration_for_individual_at_sampling, but the row and column
+		of every (birth year, sampling year) pair are worked out with array arithmetic
+		and the values are gathered in one indexing operation.
+		"""
+		self.__check_timestep()
+		birth_years, sampling_years = np.broadcast_arrays(np.asarray(birth_years, dtype=np.int64), np.asarray(sampling_years, dtype=np.int64))
+		birth_years = birth_years.ravel()
+		sampling_years = sampling_years.ravel()
+		if not len(birth_years):
+			return np.empty(0)
+
+		outside = (sampling_years < self.startyear) | (sampling_years > self.endyear)
+		if outside.any():
+			raise SWInvalidYearException('Error, sampling year %d is not in the simulation' % (sampling_years[outside][0]))
+		not_born = sampling_years - birth_years <= 0
+		if not_born.any():
+			i = np.flatnonzero(not_born)[0]
+			raise SWInvalidYearException('Error, sampling year %d is before the person was born (%d)!' %(sampling_years[i], birth_years[i]))
+
+		rows = self.__get_rows_for_people_at_sampling(birth_years, sampling_years)
+		columns = self.__get_columns_for_birth_years(birth_years)
+		return self.__gather(rows, columns)
+
+	@instrumented
 	def concentration_profile_for_individual_born_in_year(self, birth_year):
 		"""Get the lifetime concentration for the individual."""
 		self.__check_year(birth_year)
+		self.__check_timestep()
 
 		number_of_years_in_sim = self.__get_number_of_years_in_sim_for_person_born_in_year(birth_year)
 		hour = 0 if self.__is_person_born_before_simulation_start(birth_year) else self.__convert_year_to_hour(birth_year)
@@ -62,9 +150,10 @@ class SWHumanConcentrationReader(object):
 		end_index = start_index + number_of_points
 		column = self.column_dict[birth_year]
 
-		concentration = [float(x[column]) for x in self.data[start_index:end_index]]
+		concentration = self.__column(start_index, end_index, column)
 		return concentration
 
+	@instrumented
 	def extract_default_concentrations(self):
 		"""List of concentration profiles for people born after model start."""
 		start = self.startyear - self.age_at_model_start
@@ -72,6 +161,7 @@ class SWHumanConcentrationReader(object):
 		increment = s.DEFAULT_AGE_SPREAD
 		return [self.concentration_profile_for_individual_born_in_year(year) for year in range(start, end, increment)]
 
+	@instrumented
 	def extract_CBAT_for_year(self, year):
 		"""Get the cross-sectional body burden age trend for the specified year."""
 		if not self.__is_year_in_simulation(year):
@@ -79,13 +169,157 @@ class SWHumanConcentrationReader(object):
 		hour = self.__convert_year_to_hour(year)
 		ages = self.__get_ages_for_CBAT(year)
 		hour_index = self.time_step_dict[hour] - 1
+		if hour_index < self.data_start_index:
+			raise SWInvalidYearException('Error, there is no output before %d for a CBAT' % year) # the CBAT for a year is read from the row before it
 		CBAT_values = self.data[hour_index][1:]
+		if self.storage != self.LIST_STORAGE:
+			order = np.argsort(ages, kind='mergesort')
+			return (np.asarray(ages)[order], CBAT_values[order])
 		ages, CBAT_values = [list(x) for x in zip(*sorted(zip(ages, CBAT_values), key = itemgetter(0)))]
 		return (ages, CBAT_values)
 
+	@instrumented
+	def extract_CBAT_cube(self, step=s.HOURS_IN_YEAR, start_year=None, end_year=None):
+		"""Get the CBAT for every sampling time in the simulation as a year x age matrix.
+
+		step is the time between sampling times in hours (a multiple of the time step),
+		so sub-annual cross-sections are possible. Returns (years, ages, concentrations)
+		where row i of ages and concentrations is the CBAT at years[i], sorted by age.
+		The cube is built once per step, start_year and end_year only slice it.
+		"""
+		self.__check_timestep()
+		if step <= 0 or step % self.timestep:
+			raise Exception('Invalid CBAT step: %d hours for a time step of %d hours' % (step, self.timestep))
+		if step not in self.CBAT_cubes:
+			self.CBAT_cubes[step] = self.__create_CBAT_cube(step)
+		years, ages, concentrations = self.CBAT_cubes[step]
+		start = 0 if start_year is None else np.searchsorted(years, start_year, side='left')
+		end = len(years) if end_year is None else np.searchsorted(years, end_year, side='right')
+		return (years[start:end], ages[start:end], concentrations[start:end])
+
+	@instrumented
+	def resample_concentrations(self, years, kind=LINEAR_INTERPOLATION):
+		"""Get the eight human columns on a new time grid.
+
+		years are (decimal) calendar years, e.g. 2003.5. Returns an array
+		with one row per year and one column per human in the file.
+		Times outside of the simulation are NaN.
+		"""
+		self.__check_timestep()
+		hours = self.__convert_years_to_hours(years)
+		first_hour = int(self.data[self.data_start_index][0])
+		columns = np.arange(1, s.NUMBER_OF_HUMANS + 1)
+		return self.__interpolate(hours, first_hour, len(self.data) - self.data_start_index, columns[np.newaxis, :], kind)
+
+	@instrumented
+	def resample_profile_for_individual_born_in_year(self, birth_year, years, kind=LINEAR_INTERPOLATION):
+		"""Get the lifetime concentration for the individual on a new time grid.
+
+		Only the individual's own part of their column is interpolated,
+		times before they enter or after they leave the simulation are NaN.
+		"""
+		self.__check_year(birth_year)
+		self.__check_timestep()
+		hours = self.__convert_years_to_hours(years)
+		number_of_points = self.__get_number_of_years_in_sim_for_person_born_in_year(birth_year) * s.HOURS_IN_YEAR / self.timestep
+		first_hour = 0 if self.__is_person_born_before_simulation_start(birth_year) else self.__convert_year_to_hour(birth_year)
+		number_of_points = min(number_of_points, len(self.data) - self.time_step_dict[first_hour])
+		return self.__interpolate(hours, first_hour, number_of_points, self.column_dict[birth_year], kind)
+
+	def refresh(self, callback=None):
+		"""Parse the rows appended to the file since it was read or last refreshed.
+
+		Only the complete lines after follow_offset are read, so the cost depends
+		on the new data and not on the size of the file. data, time_step_dict,
+		column_dict and endyear are extended in place and the CBAT cubes dropped.
+		A file that was truncated or rewritten (shorter than follow_offset, or no
+		longer ending a line there) is read again from the start and all its rows
+		count as new, as is a file that had no data rows yet. callback(years, ages, concentrations) gets the CBAT at the
+		time of every new row (like extract_CBAT_cube). Returns the number of new rows.
+		"""
+		with measure(self.stats, 'SWHumanConcentrationReader.refresh') as phase:
+			if self.__was_rewritten() or len(self.data) == self.data_start_index: # without data rows the header may not have been complete either
+				self.__init__(self.filename, self.startyear, self.age_at_model_start, self.storage, self.cache, self.stats)
+				keep = self.data_start_index
+			else:
+				keep = self.__read_appended(phase)
+			phase.rows = len(self.data) - keep
+
+			if callback is not None and len(self.data) > keep:
+				new_rows = np.arange(keep, len(self.data))
+				hours = self.__gather(new_rows, 0)
+				years = self.startyear + hours / float(s.HOURS_IN_YEAR)
+				ages, concentrations = self.__CBAT_at(years, new_rows)
+				callback(years, ages, concentrations)
+			return len(self.data) - keep
+
+	def follow(self, poll_interval=5.0, idle_timeout=None):
+		"""Generator calling refresh() every poll_interval seconds and yielding the
+		(years, ages, concentrations) of the new rows. Stops once no rows arrived
+		for idle_timeout seconds, never if idle_timeout is None."""
+		idle = 0.0
+		while idle_timeout is None or idle < idle_timeout:
+			points = []
+			if self.refresh(lambda *cbat: points.append(cbat)):
+				idle = 0.0
+				yield points[0]
+			else:
+				time.sleep(poll_interval)
+				idle += poll_interval
+
 	# PRIVATE API
 	# Methods below should not be accessed outside of this class.
 
+	def __create_CBAT_cube(self, step):
+		"""vectorized extract_CBAT_for_year over every sampling time"""
+		hours = np.arange(step, (self.endyear - self.startyear) * s.HOURS_IN_YEAR + 1, step, dtype=np.int64)
+		if step % s.HOURS_IN_YEAR:
+			years = self.startyear + hours / float(s.HOURS_IN_YEAR)
+		else:
+			years = self.startyear + hours // s.HOURS_IN_YEAR
+
+		rows = self.time_step_dict[0] + hours // self.timestep - 1
+		ages, concentrations = self.__CBAT_at(years, rows)
+		return (years, ages, concentrations)
+
+	def __CBAT_at(self, years, rows):
+		"""ages and concentrations of the eight humans at the given years, read from the given rows, sorted by age"""
+		# Each column holds people born 80 years apart, so at most one of them satisfies 0 < age <= 80.
+		birth_years = np.array(sorted(self.column_dict), dtype=np.int64)
+		columns = np.array([self.column_dict[year] for year in birth_years], dtype=np.int64)
+		all_ages = years[:, np.newaxis] - birth_years[np.newaxis, :]
+		i, j = np.nonzero((all_ages > 0) & (all_ages <= s.HUMAN_MAX_AGE))
+		ages = np.full((len(years), s.NUMBER_OF_HUMANS), np.nan)
+		ages[i, columns[j] - 1] = all_ages[i, j]
+
+		concentrations = self.__gather(rows[:, np.newaxis], np.arange(1, s.NUMBER_OF_HUMANS + 1)[np.newaxis, :])
+
+		order = np.argsort(ages, axis=1, kind='mergesort') # columns without a person (NaN) go last
+		index = np.arange(len(years))[:, np.newaxis]
+		return (ages[index, order], concentrations[index, order])
+
+	def __interpolate(self, hours, first_hour, number_of_points, columns, kind):
+		"""interpolate the evenly spaced rows starting at first_hour for all the requested hours at once"""
+		if kind not in self.INTERPOLATION_TYPES:
+			raise Exception('Invalid interpolation: %s' % kind)
+		position = np.round((hours - first_hour) / float(self.timestep), 9) # an output time given as a decimal year lands a hair either side of its row
+		inside = (position >= 0) & (position <= number_of_points - 1)
+		lower = np.clip(np.floor(position), 0, max(number_of_points - 1, 0)).astype(np.int64)
+		upper = np.minimum(lower + 1, number_of_points - 1)
+		start_index = self.time_step_dict[first_hour]
+
+		rows = (start_index + lower)[:, np.newaxis]
+		values = self.__gather(rows, columns)
+		if kind == self.LINEAR_INTERPOLATION:
+			weight = (position - lower)[:, np.newaxis]
+			upper_values = self.__gather((start_index + upper)[:, np.newaxis], columns)
+			values = values + weight * (upper_values - values)
+		values[~inside] = np.nan
+		return values if values.shape[1] > 1 else values[:, 0]
+
+	def __convert_years_to_hours(self, years):
+		return (np.asarray(years, dtype=np.float64).ravel() - self.startyear) * s.HOURS_IN_YEAR
+
 	def __is_year_in_simulation(self, year):
 		"""determine if the year is in the simulation"""
 		return year >= self.startyear and year <= self.endyear
@@ -105,6 +339,35 @@ class SWHumanConcentrationReader(object):
 		else:
 			return (sampling_year - birth_year) * s.HOURS_IN_YEAR / self.timestep - 1
 
+	def __get_rows_for_people_at_sampling(self, birth_years, sampling_years):
+		"""vectorized __get_index_for_person_at_sampling, returning the row index in the data"""
+		born_before_start = birth_years < self.startyear
+		alive_after_end = (birth_years + s.HUMAN_MAX_AGE) > self.endyear
+
+		# same four cases as __get_number_of_years_in_sim_for_person_born_in_year
+		years_in_sim = np.where(born_before_start & alive_after_end, self.endyear - self.startyear,
+			np.where(alive_after_end, self.endyear - birth_years,
+			np.where(born_before_start, s.HUMAN_MAX_AGE - (self.startyear - birth_years), s.HUMAN_MAX_AGE)))
+		# hours are floored to whole time steps the way the scalar path does, the time step need not divide a year.
+		number_of_points = (years_in_sim * s.HOURS_IN_YEAR) // self.timestep
+		first_year = np.where(born_before_start, self.startyear, birth_years)
+		start_index = self.time_step_dict[0] + ((first_year - self.startyear) * s.HOURS_IN_YEAR) // self.timestep
+
+		index = np.where(sampling_years - birth_years > s.HUMAN_MAX_AGE, number_of_points - 1,
+			((sampling_years - first_year) * s.HOURS_IN_YEAR) // self.timestep - 1)
+		index = np.where(index < 0, index + number_of_points, index) # negative indices wrap, as they do on the profile list
+		return start_index + index
+
+	def __get_columns_for_birth_years(self, birth_years):
+		"""look up the column_dict for an array of birth years"""
+		years = np.array(sorted(self.column_dict), dtype=np.int64)
+		columns = np.array([self.column_dict[year] for year in years], dtype=np.int64)
+		i = np.clip(np.searchsorted(years, birth_years), 0, len(years) - 1)
+		invalid = years[i] != birth_years
+		if invalid.any():
+			raise SWInvalidYearException(self.INVALID_YEAR_ENTERED)
+		return columns[i]
+
 	def __is_person_older_than_max_age(self, age):
 		"""determine if person is older than the max model supported age"""
 		return age > s.HUMAN_MAX_AGE
@@ -145,12 +408,116 @@ class SWHumanConcentrationReader(object):
 		"""see if the birth year is the closest to the sampling year"""
 		return i == self.column_dict[year] and (sampling_year - year) <= s.HUMAN_MAX_AGE and (sampling_year - year) > 0
 
-	@staticmethod
-	def __read_file(filename):
-		"""read the file and return it as a list"""
+	@classmethod
+	def __read_file(cls, filename):
+		"""read the file and return it as a list, leaving out a last row that is still being written"""
 		with open(filename, 'rU') as csvfile:
 			t = csv.reader(csvfile, delimiter = ',', quotechar= '"')
-			return [line for line in t]
+			rows = [line for line in t]
+		# like __float_rows and __scan, a last row that is not a whole row of numbers is left out until it is complete.
+		if rows and not any(x.lower() == cls.TIME_STRING.lower() for x in rows[-1]) and _float_row(rows[-1], s.NUMBER_OF_HUMANS + 1) is None:
+			rows.pop()
+		return rows
+
+	@classmethod
+	def __read_array(cls, filename):
+		"""read the file and return the start row and the time and human columns as a float64 array"""
+		width = s.NUMBER_OF_HUMANS + 1
+		with open(filename, 'rU') as csvfile:
+			t = csv.reader(csvfile, delimiter = ',', quotechar= '"')
+			for start_row, row in enumerate(t):
+				if any(x.lower() == cls.TIME_STRING.lower() for x in row):
+					break
+			else:
+				raise Exception(cls.NO_HEADER % filename)
+			values = np.fromiter((x for row in cls.__float_rows(t, width) for x in row), dtype=np.float64)
+		return (start_row + 1, values.reshape(-1, width))
+
+	@staticmethod
+	def __float_rows(rows, width):
+		"""the rows as lists of floats, leaving out a last row that is still being written"""
+		previous = None
+		for row in rows:
+			if not row:
+				continue
+			if previous is not None:
+				yield [float(x) for x in previous[:width]]
+			previous = row
+		if previous is not None and _float_row(previous, width) is not None:
+			yield _float_row(previous, width)
+
+	def __open_array(self, filename, cache):
+		"""parse the file into an array, going through the sidecar cache if requested"""
+		cache_filename = filename + self.CACHE_EXTENSION
+		if cache:
+			with measure(self.stats, 'SWHumanConcentrationReader.load_cache') as phase:
+				cached = self.__load_cache(filename, cache_filename)
+				phase.rows = len(cached[1]) if cached is not None else 0
+			if cached is not None:
+				self.data_start_row, data = cached
+				return data
+		with measure(self.stats, 'SWHumanConcentrationReader.read_array') as phase:
+			self.data_start_row, data = self.__read_array(filename)
+			phase.rows, phase.cells = len(data), data.size
+		if cache:
+			with measure(self.stats, 'SWHumanConcentrationReader.write_cache') as phase:
+				self.__write_cache(filename, cache_filename, data)
+				phase.rows, phase.cells = len(data), data.size
+		return data
+
+	@classmethod
+	def __load_cache(cls, filename, cache_filename):
+		"""memory-map the cached array, or return None if the cache is missing or stale"""
+		try:
+			source = os.stat(filename)
+			with open(cache_filename, 'rb') as f:
+				header = f.read(cls.CACHE_HEADER.size)
+			cache_size = os.path.getsize(cache_filename)
+		except (IOError, OSError):
+			return None
+		if len(header) != cls.CACHE_HEADER.size:
+			return None
+		magic, version, size, mtime, start_row, rows, columns = cls.CACHE_HEADER.unpack(header)
+		if magic != cls.CACHE_MAGIC or version != cls.CACHE_VERSION:
+			return None
+		if size != source.st_size or mtime != source.st_mtime:
+			return None
+		if cache_size != cls.CACHE_HEADER.size + rows * columns * np.dtype(np.float64).itemsize:
+			return None
+		data = np.memmap(cache_filename, dtype='<f8', mode='r', offset=cls.CACHE_HEADER.size, shape=(rows, columns))
+		return (start_row, data)
+
+	def __write_cache(self, filename, cache_filename, data):
+		"""write the parsed array next to the source file. Failing to write the cache is not fatal."""
+		source = os.stat(filename)
+		header = self.CACHE_HEADER.pack(self.CACHE_MAGIC, self.CACHE_VERSION, source.st_size, source.st_mtime,
+			self.data_start_row, data.shape[0], data.shape[1])
+		temp_filename = cache_filename + '.tmp'
+		try:
+			with open(temp_filename, 'wb') as f:
+				f.write(header)
+				f.write(np.ascontiguousarray(data, dtype='<f8').tobytes())
+			if os.path.exists(cache_filename):
+				os.remove(cache_filename)
+			os.rename(temp_filename, cache_filename)
+		except (IOError, OSError):
+			if os.path.exists(temp_filename):
+				os.remove(temp_filename)
+
+	def __column(self, start_index, end_index, column):
+		"""concentrations in a column between two row indices"""
+		if self.storage != self.LIST_STORAGE:
+			return self.data[start_index:end_index, column]
+		return [float(x[column]) for x in self.data[start_index:end_index]]
+
+	def __gather(self, rows, columns):
+		"""concentrations at the (row, column) pairs as a float64 array"""
+		rows, columns = np.broadcast_arrays(rows, columns)
+		if self.storage == self.ARRAY_STORAGE:
+			return np.asarray(self.data[rows, columns], dtype=np.float64)
+		if self.storage == self.LAZY_STORAGE:
+			return self.data[rows.ravel(), columns.ravel()].reshape(rows.shape)
+		return np.array([float(self.data[row][column]) for row, column in zip(rows.ravel(), columns.ravel())], dtype=np.float64).reshape(rows.shape)
 
 	def __create_column_dict(self):
 		#essentially a map that links the year a person was born in to the column they reside in within C.txt file.
@@ -159,25 +526,372 @@ class SWHumanConcentrationReader(object):
 
 	def __create_time_step_dict(self):
 		# dict structure: {hour : index of that hour}
-		start_index = self.__determine_index_at_data_start()
+		start_index = self.data_start_index
+		if self.storage == self.LAZY_STORAGE:
+			return SWTimeStepIndex(self.data.hours, start_index, self.timestep)
+		if self.storage == self.ARRAY_STORAGE:
+			return SWTimeStepIndex(self.data[:, 0], start_index, self.timestep)
 		return {int(self.data[i][0]) : i for i in range(start_index, len(self.data))}
 
+	def __extend(self, keep, offsets, rows, end_offset):
+		"""replace the data rows from index keep on with the newly parsed rows, and index them"""
+		if self.storage == self.LIST_STORAGE:
+			for row in self.data[keep:]:
+				self.time_step_dict.pop(int(row[0]), None)
+			del self.data[keep:]
+			self.data.extend(rows)
+			self.time_step_dict.update((int(self.data[i][0]), i) for i in range(keep, len(self.data)))
+		elif self.storage == self.ARRAY_STORAGE:
+			width = self.data.shape[1]
+			values = np.array([[float(x) for x in row[:width]] for row in rows], dtype=np.float64).reshape(-1, width)
+			end = keep + len(values)
+			if self.__buffer is None or len(self.__buffer) < end:
+				buffer = np.empty((max(end, 2 * len(self.data)), width)) # doubling keeps appending amortized O(new rows)
+				buffer[:keep] = self.data[:keep]
+				self.__buffer = buffer
+			self.__buffer[keep:end] = values
+			self.data = self.__buffer[:end]
+			self.time_step_dict.hours = self.data[:, 0]
+		else:
+			hours = [int(float(row[0])) for row in rows]
+			self.data.extend(keep, offsets, hours, end_offset)
+			self.time_step_dict.hours = self.data.hours
+
+	def __was_rewritten(self):
+		"""True if the file is shorter than follow_offset or the byte before it is no longer a newline"""
+		if os.path.getsize(self.filename) < self.follow_offset:
+			return True
+		if self.follow_offset == 0:
+			return False
+		with open(self.filename, 'rb') as f:
+			f.seek(self.follow_offset - 1)
+			return f.read(1) != b'\n'
+
+	def __read_appended(self, phase):
+		"""extend the data with the complete lines after follow_offset, returns the number of rows kept"""
+		with open(self.filename, 'rb') as f:
+			f.seek(self.follow_offset)
+			appended = f.read()
+		complete = appended[:appended.rfind(b'\n') + 1]
+		if not complete:
+			return len(self.data)
+
+		offsets = []
+		lines = []
+		offset = self.follow_offset
+		for line in complete.splitlines(True):
+			if line.strip():
+				offsets.append(offset)
+				lines.append(line)
+			offset += len(line)
+		rows = [row for row in csv.reader(lines, delimiter = ',', quotechar= '"')]
+		keep = len(self.data) - 1 if self.follow_partial_row else len(self.data)
+		self.__extend(keep, offsets, rows, offset)
+		self.follow_offset = offset
+		self.follow_partial_row = False
+		if self.timestep is None: # a run that had just started, the time step is known from the second data row on
+			self.timestep = self.__determine_timestep()
+			self.time_step_dict = self.__create_time_step_dict()
+
+		self.endyear = self.__determine_endyear()
+		self.column_dict.update(self.__create_column_dict())
+		self.CBAT_cubes = {}
+		phase.cells = sum(len(row) for row in rows)
+		return keep
+
+	@staticmethod
+	def __last_complete_line(filename):
+		"""offset just after the last newline of the file, and the partial line after it"""
+		with open(filename, 'rb') as f:
+			f.seek(0, os.SEEK_END)
+			position = f.tell()
+			tail = b''
+			while position > 0:
+				start = max(0, position - 65536)
+				f.seek(start)
+				tail = f.read(position - start) + tail
+				i = tail.rfind(b'\n')
+				if i >= 0:
+					return (start + i + 1, tail[i + 1:])
+				position = start
+			return (0, tail)
+
+	def __determine_endyear(self):
+		if len(self.data) == self.data_start_index: # no output yet
+			return self.startyear
+		return int(self.data[len(self.data) - 1][0]) / s.HOURS_IN_YEAR + self.startyear
+
 	def __determine_index_at_data_start(self):
+		if self.storage != self.LIST_STORAGE:
+			return 0 # the header is dropped when the array or the offsets are built.
 		for i, row in enumerate(self.data):
 			if any(s.lower() == self.TIME_STRING.lower() for s in row):
 				return i + 1;
+		raise Exception(self.NO_HEADER % self.filename)
 
 	def __determine_timestep(self):
-		i = self.__determine_index_at_data_start()
+		# None until there are two data rows, as when a run has just started.
+		i = self.data_start_index
+		if len(self.data) - i < 2:
+			return None
 		return int(self.data[i + 1][0]) - int(self.data[i][0])
 
 	def __check_year(self, year):
 		if not year in self.column_dict:
 			raise SWInvalidYearException(self.INVALID_YEAR_ENTERED)
 
+	def __check_timestep(self):
+		if self.timestep is None:
+			raise Exception('Error, the time step of %s is not known until it has two data rows' % self.filename)
+
 	def __convert_year_to_hour(self, year):
 		return (year - self.startyear) * s.HOURS_IN_YEAR
 
+class SWTimeStepIndex(object):
+	"""docstring for SWTimeStepIndex
+
+	Read-only stand-in for the {hour : index of that hour} dict
+	of an evenly spaced time column. The index is computed
+	from the hour instead of being stored, so building it
+	costs nothing no matter how long the simulation is.
+	"""
+
+	def __init__(self, hours, start_index, timestep):
+		super(SWTimeStepIndex, self).__init__()
+		self.hours = hours
+		self.start_index = start_index
+		self.timestep = timestep
+
+	def __getitem__(self, hour):
+		i = self.__index(hour)
+		if i is None:
+			raise KeyError(hour)
+		return i
+
+	def __contains__(self, hour):
+		return self.__index(hour) is not None
+
+	def __len__(self):
+		return len(self.hours)
+
+	def __iter__(self):
+		return (int(hour) for hour in self.hours)
+
+	def get(self, hour, default=None):
+		i = self.__index(hour)
+		return default if i is None else i
+
+	def keys(self):
+		return list(self)
+
+	def __index(self, hour):
+		if not len(self.hours):
+			return None
+		offset = hour - int(self.hours[0])
+		if self.timestep is None: # a single row, the time step is not known yet
+			return self.start_index if offset == 0 else None
+		if offset < 0 or offset % self.timestep:
+			return None
+		i = offset // self.timestep
+		if i >= len(self.hours) or int(self.hours[i]) != hour:
+			return None
+		return i + self.start_index
+
+class SWLazyConcentrationRows(object):
+	"""docstring for SWLazyConcentrationRows
+
+	Array-like view of the data rows of a concentration file
+	that only keeps the byte offset and hour of every row.
+	Rows are read and parsed from disk when they are indexed,
+	e.g. rows[i], rows[start:end] or rows[start:end, column].
+	"""
+
+	def __init__(self, filename, time_string):
+		super(SWLazyConcentrationRows, self).__init__()
+		self.filename = filename
+		self.width = s.NUMBER_OF_HUMANS + 1
+		self.offsets, self.hours, self.end_offset = self.__scan(filename, time_string, self.width)
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def __getitem__(self, key):
+		if isinstance(key, tuple):
+			rows, column = key
+			if isinstance(rows, np.ndarray):
+				return self.take(rows)[np.arange(len(rows)), column]
+			return self[rows][..., column]
+		if isinstance(key, np.ndarray):
+			return self.take(key)
+		if isinstance(key, slice):
+			start, stop, step = key.indices(len(self))
+			return self.__read_block(start, max(start, stop))[::step]
+		if key < 0:
+			key += len(self)
+		if key < 0 or key >= len(self):
+			raise IndexError('row %d is out of range' % key)
+		return self.__read_block(key, key + 1)[0]
+
+	def extend(self, keep, offsets, hours, end_offset):
+		"""keep the first keep rows and add rows found after the scanned part of the file"""
+		self.offsets = np.concatenate((self.offsets[:keep], np.array(offsets, dtype=np.int64)))
+		self.hours = np.concatenate((self.hours[:keep], np.array(hours, dtype=np.int64)))
+		self.end_offset = end_offset
+
+	def take(self, rows):
+		"""parse an arbitrary set of rows, reading each distinct row once"""
+		unique, inverse = np.unique(rows, return_inverse=True)
+		if len(unique) and (unique[0] < 0 or unique[-1] >= len(self)):
+			raise IndexError('row index out of range')
+		values = np.empty((len(unique), self.width))
+		with open(self.filename, 'rb') as f:
+			for i, row in enumerate(unique):
+				f.seek(self.offsets[row])
+				values[i] = [float(x) for x in next(csv.reader([f.readline()], delimiter = ',', quotechar= '"'))[:self.width]]
+		return values[inverse]
+
+	def __read_block(self, start, stop):
+		"""parse the contiguous rows [start, stop) into a float64 array"""
+		if start >= stop:
+			return np.empty((0, self.width))
+		end_offset = self.offsets[stop] if stop < len(self) else self.end_offset
+		with open(self.filename, 'rb') as f:
+			f.seek(self.offsets[start])
+			lines = f.read(end_offset - self.offsets[start]).splitlines()
+		t = csv.reader(lines, delimiter = ',', quotechar= '"')
+		values = np.fromiter((float(x) for row in t if row for x in row[:self.width]), dtype=np.float64)
+		return values.reshape(-1, self.width)
+
+	@staticmethod
+	def __scan(filename, time_string, width):
+		"""single pass over the file recording the offset and hour of every data row"""
+		offsets = []
+		hours = []
+		offset = 0
+		end_offset = 0
+		with open(filename, 'rb') as f:
+			for line in iter(f.readline, b''):
+				offset += len(line)
+				if any(x.lower() == time_string.lower() for x in next(csv.reader([line]), [])):
+					break
+			else:
+				raise Exception('Error, no %s header row found in file %s' % (time_string, filename))
+			end_offset = offset
+			for line in iter(f.readline, b''):
+				# a last line without a newline may still be being written, it is only used if it is a whole row.
+				if line.strip() and (line.endswith(b'\n') or _float_row(next(csv.reader([line])), width) is not None):
+					offsets.append(offset)
+					hours.append(int(float(line.split(b',', 1)[0].strip(b'" '))))
+					end_offset = offset + len(line)
+				offset += len(line)
+		return (np.array(offsets, dtype=np.int64), np.array(hours, dtype=np.int64), end_offset)
+
+class SWHumanConcentrationEnsemble(object):
+	"""docstring for SWHumanConcentrationEnsemble
+
+	A collection of SWHumanConcentrationReader instances, one per
+	ACC-HUMAN output file in a directory (or matching a glob),
+	loaded in parallel and queried together.
+
+	parameters maps a file name (or its full path) to the keyword
+	arguments of its reader, e.g. {'seqn 21005.csv' : {'age_at_model_start' : 5}}.
+
+	Only in-memory readers are parsed in the pool and sent back whole.
+	With cache the workers only write the sidecars and the readers are
+	opened on them here, lazy readers are opened here directly.
+	"""
+
+	def __init__(self, path, parameters=None, processes=None, startyear=s.DEFAULT_START_YEAR, age_at_model_start=s.DEFAULT_AGE_AT_MODEL_START, storage=SWHumanConcentrationReader.ARRAY_STORAGE, cache=False):
+		super(SWHumanConcentrationEnsemble, self).__init__()
+		self.path = path
+		self.parameters = parameters or {}
+		self.filenames = self.__find_files(path)
+		if not self.filenames:
+			raise IOError('Error, no concentration files found for %s' % path)
+
+		defaults = {'startyear' : startyear, 'age_at_model_start' : age_at_model_start, 'storage' : storage, 'cache' : cache}
+		jobs = [(filename, dict(defaults, **self.__parameters_for_file(filename))) for filename in self.filenames]
+		self.readers = OrderedDict(zip(self.filenames, self.__load(jobs, processes)))
+
+	def __len__(self):
+		return len(self.readers)
+
+	def __getitem__(self, filename):
+		return self.readers[filename]
+
+	def concentration_for_individual_at_sampling(self, birth_year, sampling_year):
+		"""Concentration at sampling for every file. NaN where the year is not in that file's simulation."""
+		return self.__query(lambda reader: reader.concentration_for_individual_at_sampling(birth_year, sampling_year), np.nan)
+
+	def concentrations_for_individuals_at_sampling(self, birth_years, sampling_years):
+		"""Batch concentrations at sampling for every file. None where the years are not in that file's simulation."""
+		return self.__query(lambda reader: reader.concentrations_for_individuals_at_sampling(birth_years, sampling_years), None)
+
+	def concentration_profile_for_individual_born_in_year(self, birth_year):
+		"""Lifetime concentration for every file. None where the birth year is not in that file's simulation."""
+		return self.__query(lambda reader: reader.concentration_profile_for_individual_born_in_year(birth_year), None)
+
+	def extract_CBAT_for_year(self, year):
+		"""CBAT for every file. None where the year is not in that file's simulation."""
+		return self.__query(lambda reader: reader.extract_CBAT_for_year(year), None)
+
+	# Private methods below.
+
+	def __query(self, method, missing):
+		ret = OrderedDict()
+		for filename, reader in self.readers.items():
+			try: ret[filename] = method(reader)
+			except SWInvalidYearException: ret[filename] = missing
+		return ret
+
+	def __parameters_for_file(self, filename):
+		if filename in self.parameters:
+			return self.parameters[filename]
+		return self.parameters.get(os.path.basename(filename), {})
+
+	@staticmethod
+	def __find_files(path):
+		"""the concentration files in a directory, or the files matching a glob"""
+		if os.path.isdir(path):
+			names = [name for name in os.listdir(path) if any(accepted.upper() in name.upper() for accepted in SWHumanConcentrationReader.ACCEPTED_FILENAMES)]
+			filenames = [os.path.join(path, name) for name in names]
+		else:
+			filenames = glob.glob(path)
+		return sorted(f for f in filenames if os.path.isfile(f) and not f.endswith(SWHumanConcentrationReader.CACHE_EXTENSION))
+
+	@staticmethod
+	def __load(jobs, processes):
+		"""build the readers in a process pool, parsing is CPU bound"""
+		# a lazy reader only scans for row offsets, there is nothing to parse in a worker.
+		parsed = [job for job in jobs if job[1].get('storage') != SWHumanConcentrationReader.LAZY_STORAGE]
+		if processes == 1 or len(parsed) <= 1:
+			loaded = [_load_reader(job) for job in parsed]
+		else:
+			pool = multiprocessing.Pool(processes)
+			try:
+				loaded = pool.map(_load_reader, parsed)
+			finally:
+				pool.close()
+				pool.join()
+		loaded = dict((job[0], reader) for job, reader in zip(parsed, loaded))
+		# workers hand back the file name of a cached reader, it is opened on the fresh sidecar here.
+		return [loaded[filename] if isinstance(loaded.get(filename), SWHumanConcentrationReader) else SWHumanConcentrationReader(filename, **kwargs) for filename, kwargs in jobs]
+
+def _load_reader(job):
+	"""process pool worker for SWHumanConcentrationEnsemble, a cached reader only writes its sidecar and returns its file name"""
+	filename, kwargs = job
+	reader = SWHumanConcentrationReader(filename, **kwargs)
+	if kwargs.get('cache'):
+		return filename
+	return reader
+
+def _float_row(row, width):
+	"""the first width values of a row as floats, None if the row is short or not a number"""
+	if len(row) < width:
+		return None
+	try: return [float(x) for x in row[:width]]
+	except ValueError: return None
+
 class SWInvalidYearException(Exception):
 	def __init__(self, message):
 		self.message = message
@@ -0,0 +1,140 @@
+# SWModelComparison.py
+# Compares ACC-HUMAN predictions (SWHumanConcentrationReader) with
+# NHANES observations (SWNhanesReader or SWNhanesPanel) for every respondent at once.
+
+import numpy as np
+import SWSettings as s
+from SWNhanesReader import SWNhanesPanel
+
+class SWModelComparison(object):
+	"""docstring for SWModelComparison
+
+	Joins every NHANES respondent with an ACC-HUMAN prediction.
+	The model file is CMAN or CWOMAN depending on RIAGENDR and the
+	prediction is its CBAT at the sampling year interpolated at
+	RIDAGEYR, so a respondent is compared at their own age and not
+	at the age of the closest simulated cohort. Ages below the youngest
+	or above the oldest simulated person of that year get the value of
+	that person and are marked in the clamped column.
+
+	models maps a PCB to its (CMAN reader, CWOMAN reader) pair, e.g.
+	{'PCB-153' : (SWHumanConcentrationReader('CMAN.txt'), SWHumanConcentrationReader('CWOMAN.txt'))}.
+	sampling_years maps a cycle to the year used as the sampling year,
+	by default the first year of the cycle.
+	"""
+
+	MALE = 1
+	FEMALE = 2
+
+	def __init__(self, nhanes, models, sampling_years=None):
+		super(SWModelComparison, self).__init__()
+		self.nhanes = nhanes
+		self.models = models
+		self.sampling_years = sampling_years or {}
+		self.table = self.compare()
+		self.metrics = self.compute_metrics()
+
+	def compare(self):
+		"""Aligned arrays of observed, predicted and residual values for every respondent and PCB."""
+		pcbs = list(self.models)
+		codes = [self.nhanes.get_nhanes_code_for_pcb(pcb) for pcb in pcbs]
+		seqn = self.nhanes.get_seqn_array()
+		ages, genders, concentrations = self.nhanes.get_arrays_for_codes(codes)
+		sampling_years = self.get_sampling_years(len(seqn))
+
+		columns = {'seqn' : [], 'pcb' : [], 'gender' : [], 'age' : [], 'sampling_year' : [], 'birth_year' : [], 'model_birth_year' : [], 'observed' : [], 'predicted' : [], 'clamped' : []}
+		for pcb, code, observed in zip(pcbs, codes, concentrations):
+			rows = np.flatnonzero(~np.isnan(observed) & ~np.isnan(ages) & ((genders == self.MALE) | (genders == self.FEMALE)))
+			birth_years = sampling_years[rows] - ages[rows].astype(np.int64)
+			model_birth_years = np.full(len(rows), -1, dtype=np.int64) # -1 without a reader for the gender
+			predicted = np.full(len(rows), np.nan)
+			clamped = np.zeros(len(rows), dtype=bool)
+			for gender, reader in zip((self.MALE, self.FEMALE), self.models[pcb]):
+				if reader is None:
+					continue
+				i = np.flatnonzero(genders[rows] == gender)
+				model_birth_years[i] = self.nearest_cohorts(reader, birth_years[i])
+				predicted[i], clamped[i] = self.CBAT_at_ages(reader, ages[rows][i], sampling_years[rows][i])
+
+			columns['seqn'].append(seqn[rows])
+			columns['pcb'].append(np.repeat(np.array([code], dtype=str), len(rows)))
+			columns['gender'].append(genders[rows].astype(np.int64))
+			columns['age'].append(ages[rows])
+			columns['sampling_year'].append(sampling_years[rows])
+			columns['birth_year'].append(birth_years)
+			columns['model_birth_year'].append(model_birth_years)
+			columns['observed'].append(observed[rows])
+			columns['predicted'].append(predicted)
+			columns['clamped'].append(clamped)
+
+		table = dict((name, np.concatenate(values) if values else np.empty(0)) for name, values in columns.items())
+		table['residual'] = table['observed'] - table['predicted']
+		with np.errstate(divide='ignore', invalid='ignore'):
+			table['log_ratio'] = np.log10(table['observed'] / table['predicted'])
+		return table
+
+	def compute_metrics(self):
+		"""Error metrics per PCB code and over all PCBs ('all'), for the respondents with a prediction."""
+		metrics = {}
+		pcbs = np.unique(self.table['pcb']).tolist() + ['all']
+		for pcb in pcbs:
+			rows = ~np.isnan(self.table['predicted'])
+			if pcb != 'all':
+				rows &= self.table['pcb'] == pcb
+			residual = self.table['residual'][rows]
+			log_ratio = self.table['log_ratio'][rows]
+			log_ratio = log_ratio[np.isfinite(log_ratio)]
+			metrics[pcb] = {
+				'count' : int(rows.sum()),
+				'clamped' : int(self.table['clamped'][rows].sum()),
+				'mean_residual' : np.mean(residual) if len(residual) else np.nan,
+				'rmse' : np.sqrt(np.mean(residual ** 2)) if len(residual) else np.nan,
+				'mean_log_ratio' : np.mean(log_ratio) if len(log_ratio) else np.nan,
+				'rms_log_ratio' : np.sqrt(np.mean(log_ratio ** 2)) if len(log_ratio) else np.nan,
+				'within_factor_of_2' : np.mean(np.abs(log_ratio) <= np.log10(2)) if len(log_ratio) else np.nan,
+			}
+		return metrics
+
+	# Private methods below.
+
+	def get_sampling_years(self, number_of_respondents):
+		"""sampling year of every respondent from their cycle"""
+		if isinstance(self.nhanes, SWNhanesPanel):
+			cycles = self.nhanes.data.column(SWNhanesPanel.CYCLE_CODE)
+			years = np.zeros(number_of_respondents, dtype=np.int64)
+			for cycle in np.unique(cycles):
+				years[cycles == cycle] = self.sampling_year_for_cycle(cycle)
+			return years
+		return np.repeat(self.sampling_year_for_cycle(self.nhanes.nhanes_year), number_of_respondents).astype(np.int64)
+
+	def sampling_year_for_cycle(self, cycle):
+		return self.sampling_years.get(cycle, int(str(cycle).split('-')[0]))
+
+	def CBAT_at_ages(self, reader, ages, sampling_years):
+		"""the reader's CBAT at each sampling year interpolated at each age, NaN outside of the simulated years
+
+		Ages outside of the CBAT get the value of its youngest or oldest person and are
+		flagged in the second array. The CBAT is read with concentrations_for_individuals_at_sampling,
+		which floors hours to whole time steps, so the time step need not divide a year.
+		"""
+		predicted = np.full(len(ages), np.nan)
+		clamped = np.zeros(len(ages), dtype=bool)
+		cohorts = np.array(sorted(reader.column_dict), dtype=np.int64)
+		for year in np.unique(sampling_years):
+			if year <= reader.startyear or year > reader.endyear: # the CBAT for a year is read from the row before it
+				continue
+			birth_years = cohorts[(year - cohorts > 0) & (year - cohorts <= s.HUMAN_MAX_AGE)][::-1] # youngest first
+			CBAT_ages = year - birth_years
+			CBAT_values = reader.concentrations_for_individuals_at_sampling(birth_years, year)
+			i = np.flatnonzero(sampling_years == year)
+			predicted[i] = np.interp(ages[i], CBAT_ages, CBAT_values)
+			clamped[i] = (ages[i] < CBAT_ages[0]) | (ages[i] > CBAT_ages[-1])
+		return (predicted, clamped)
+
+	def nearest_cohorts(self, reader, birth_years):
+		"""the simulated birth year (column_dict) closest to each birth year, for reference only"""
+		cohorts = np.array(sorted(reader.column_dict), dtype=np.int64)
+		i = np.clip(np.searchsorted(cohorts, birth_years), 1, len(cohorts) - 1)
+		earlier = cohorts[i - 1]
+		later = cohorts[i]
+		return np.where(birth_years - earlier <= later - birth_years, earlier, later)
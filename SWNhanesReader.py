@@ -1,9 +1,15 @@
 # SWNhanesReader.py
 
+import copy
 import csv
 import re
+import hashlib
+import json
+import multiprocessing
+import shutil
 import numpy as np
 import SWSettings as s
+from SWStats import instrumented, measure
 import os
 
 type_dict = {
@@ -23,6 +29,10 @@ type_dict = {
 class SWNhanesReader(object):
 
 	READ_DIETARY_INFO = True # Save time if false
+	DEFAULT_AGE_BIN_EDGES = tuple(range(11, 92, s.DEFAULT_AGE_SPREAD)) # 11-20, 21-30, ..., 81-90
+	LAZY_DIET = 'lazy' # diet = LAZY_DIET indexes the food records by SEQN and only parses the ones asked for
+	CACHE_FOLDER = '.swcache' # parsed cycles are cached in this folder inside the cycle's data folder
+	CACHE_VERSION = 1
 
 	"""docstring for NhanesReader
 
@@ -34,28 +44,54 @@ class SWNhanesReader(object):
 	"""
 
 	# Public API.
-	def __init__(self, nhanes_year='2003-2004', diet = False):
+	def __init__(self, nhanes_year='2003-2004', diet = False, columnar = False, cache = False, variables = None, processes = 1, stats = None):
 		super(SWNhanesReader, self).__init__()
-		self.READ_DIETARY_INFO = diet # save a lot of time reading data if False
+		self.READ_DIETARY_INFO = diet and diet != self.LAZY_DIET # save a lot of time reading data if False
 		self.nhanes_year = nhanes_year
+		# only read these variables (NHANES codes or PCB congeners like 'PCB-153') if given, and only the files that contain them.
+		self.variables = self.selected_variables(variables)
+		self.columnar = columnar or cache # SWNhanesTable instead of a dict of dicts if True, the cache always holds a table
+		self.cache = cache # memory-map a parsed copy of the cycle if True
+		self.processes = processes # parse the files in a process pool of this size if not 1 (None uses every core)
+		self.stats = stats # SWStats recording the load phases and queries if given
 		self.data = self.obtain_data()
+		self.index = self.build_index()
+		self.food = None
+		if diet == self.LAZY_DIET:
+			with measure(stats, 'SWNhanesReader.index_food_records') as phase:
+				self.food = SWNhanesFoodIndex(self.diet_filename(), self)
+				phase.rows = len(self.food.seqn)
 
+	@instrumented
 	def concentration_for_seqn_for_pcb(self, seqn, pcb):
 		#return self.data[seqn][self.get_nhanes_code_for_pcb(pcb)]
+		if self.columnar:
+			return self.data.value(seqn, self.get_nhanes_code_for_pcb(pcb))
 		return self.data.get(seqn).get(self.get_nhanes_code_for_pcb(pcb))
 
+	@instrumented
 	def get_list_of_seqn_for_pcb(self, pcb='PCB-153'): # Default is PCB-153
 		pcb_string = self.get_nhanes_code_for_pcb(pcb)
-		return [seqn for seqn in self.data if pcb_string in self.data[seqn]];
+		if self.columnar:
+			return self.data.seqn[self.index.rows(pcb_string)]
+		return self.index.seqn[self.index.rows(pcb_string)].tolist()
 
+	@instrumented
 	def get_list_of_seqn(self):
+		if self.columnar:
+			return self.data.seqn
 		return self.data.keys()
 
+	@instrumented
 	def get_concentration_list_for_pcb(self, pcb):
+		if self.columnar:
+			nhanes_code = self.get_nhanes_code_for_pcb(pcb)
+			return self.data.column(nhanes_code)[self.index.rows(nhanes_code)]
 		seqn_list = self.get_list_of_seqn_for_pcb(pcb)
 		nhanes_code = self.get_nhanes_code_for_pcb(pcb)
 		return [self.data.get(x).get(nhanes_code) for x in seqn_list]
 
+	@instrumented
 	def get_median_concentration_for_pcb_for_gender(self, pcb, female):
 		# get all median concentrations for a particular PCB
 		# for male or female
@@ -77,26 +113,29 @@ class SWNhanesReader(object):
 		return [ages, concentrations]
 
 
+	@instrumented
 	def get_median_concentration_for_all_ages_for_pcb_for_gender(self, pcb, female):
 
 		# Return the median of the reported NHANES PCB concentrations for a specific gender and specific PCB.
 
 		pcb_string = self.get_nhanes_code_for_pcb(pcb)
-		seqn_list = self.get_list_of_seqn_for_pcb(pcb)
 
-		c_list = []
+		if self.columnar:
+			return np.median(self.data.column(pcb_string)[self.rows_for_pcb_for_gender(pcb_string, female)])
 
-		gender = 2 if female else 1
+		seqn_list = self.seqn_for_pcb_for_gender(pcb_string, female)
+
+		c_list = []
 
 		for seqn in seqn_list:
-			if self.data[seqn][s.GENDER_CODE] == gender:
-				c_list.append(self.data[seqn][pcb_string])
+			c_list.append(self.data[seqn][pcb_string])
 
 
 		median = np.median(c_list)
 
 		return median
 
+	@instrumented
 	def get_median_concentration_for_pcb_for_age_group_for_gender(self, pcb, min_age, max_age, female):
 		# get median concentration of a PCB
 		# for a certain age group
@@ -106,44 +145,211 @@ class SWNhanesReader(object):
 		median_age = np.median(ages)
 		return [median_age, median_concentration]
 
+	@instrumented
 	def get_concentrations_for_pcb_for_age_group_for_gender(self, pcb, min_age, max_age, female):
 		# return all concentrations of a certain PCB
 		# for a certain age group
 		# and for male or female
 		pcb_string = self.get_nhanes_code_for_pcb(pcb)
-		seqn_list = self.get_list_of_seqn_for_pcb(pcb)
-		gender = self.gender_number_if_female(female)
+
+		if self.columnar:
+			rows = self.rows_for_pcb_for_gender(pcb_string, female, min_age, max_age)
+			return [self.data.column(s.AGE_CODE)[rows], self.data.column(pcb_string)[rows]]
+
+		seqn_list = self.seqn_for_pcb_for_gender(pcb_string, female, min_age, max_age)
 
 		ages = []
 		concentrations = []
 
 		for seqn in seqn_list:
-			if self.data[seqn][s.GENDER_CODE] == gender:
-				if self.data[seqn][s.AGE_CODE] >= min_age and self.data[seqn][s.AGE_CODE] <= max_age:
-					ages.append(self.data[seqn][s.AGE_CODE])
-					concentrations.append(self.data[seqn][pcb_string])
+			ages.append(self.data[seqn][s.AGE_CODE])
+			concentrations.append(self.data[seqn][pcb_string])
 
 		return [ages, concentrations]
 
+	@instrumented
 	def get_age_and_concentration_for_pcb_for_gender(self, pcb, female):
 		pcb_string = self.get_nhanes_code_for_pcb(pcb)
-		seqn_list = self.get_list_of_seqn_for_pcb(pcb)
-		gender = self.gender_number_if_female(female)
+
+		if self.columnar:
+			rows = self.rows_for_pcb_for_gender(pcb_string, female, with_age = True)
+			return [self.data.column(s.AGE_CODE)[rows], self.data.column(pcb_string)[rows]]
+
+		seqn_list = self.seqn_for_pcb_for_gender(pcb_string, female, with_age = True)
 
 		ages = []
 		concentrations = []
 		for seqn in seqn_list:
-			if self.data[seqn][s.GENDER_CODE] == gender:
-				ages.append(self.data[seqn][s.AGE_CODE])
-				concentrations.append(self.data[seqn][pcb_string])
+			ages.append(self.data[seqn][s.AGE_CODE])
+			concentrations.append(self.data[seqn][pcb_string])
 
 		return [ages, concentrations]
 
+	@instrumented
+	def food_records_for_seqn(self, seqn):
+		# {food number : {variable : value}} for one respondent, like data[seqn]['food_index'].
+		if self.food is not None:
+			return self.food.records_for_seqn(seqn)
+		if not self.columnar:
+			return self.data[seqn]['food_index']
+		food = self.data.food
+		rows = range(*food.rows_for_seqn(seqn).indices(len(food)))
+		return dict((food.columns['food_index'][i].item(), dict((var, food.columns[var][i].item()) for var in food.columns if var != 'food_index' and food.masks[var][i])) for i in rows)
+
+	def iter_food_records(self, chunk_size = 10000):
+		# yield the food records in chunks of at most chunk_size (seqn, food number, {variable : value}) tuples.
+		if self.food is not None:
+			for chunk in self.food.iter_records(chunk_size):
+				yield chunk
+			return
+		chunk = []
+		for seqn in sorted(self.get_list_of_seqn()):
+			for food_index, record in sorted(self.food_records_for_seqn(seqn).items()):
+				chunk.append((seqn, food_index, record))
+				if len(chunk) >= chunk_size:
+					yield chunk
+					chunk = []
+		if chunk:
+			yield chunk
+
+	@instrumented
+	def get_median_concentration_ci_for_pcb_for_age_group_for_gender(self, pcb, min_age, max_age, female, replicates = 1000, confidence = 95, seed = None, chunk_size = None):
+		# median age, median concentration and the bootstrap confidence interval of the median
+		# of a PCB for a certain age group and for male or female.
+		ages, concentrations = self.get_concentrations_for_pcb_for_age_group_for_gender(pcb, min_age, max_age, female)
+		lower, upper = bootstrap_confidence_interval(concentrations, np.median, replicates, confidence, seed, chunk_size)
+		return [np.median(ages), np.median(concentrations), lower, upper]
+
+	@instrumented
+	def get_summary_for_pcbs(self, pcbs, percentiles = (50,), bin_edges = DEFAULT_AGE_BIN_EDGES, replicates = 0, confidence = 95, seed = None, chunk_size = None):
+		# counts, median ages and concentration percentiles
+		# for every PCB x gender x age group, in one pass over the respondents.
+		# Age groups are [bin_edges[i], bin_edges[i + 1]) and the rows are ordered pcb, gender (male first), age group.
+		# With replicates > 0 a bootstrap confidence interval of every median is added as 'median_ci'.
+		# Returns a dict of aligned arrays.
+		codes = [self.get_nhanes_code_for_pcb(pcb) for pcb in pcbs]
+		ages, genders, concentrations = self.get_arrays_for_codes(codes)
+		bin_edges = np.asarray(bin_edges, dtype=np.float64)
+		percentiles = np.asarray(percentiles, dtype=np.float64)
+		number_of_bins = len(bin_edges) - 1
+		number_of_groups = 2 * number_of_bins
+
+		# group number of each respondent: gender (0 male, 1 female) then age group, -1 if outside.
+		age_bin = np.searchsorted(bin_edges, ages, side='right') - 1
+		in_bins = (age_bin >= 0) & (age_bin < number_of_bins) & ((genders == 1) | (genders == 2))
+		group = np.where(in_bins, (genders - 1) * number_of_bins + age_bin, -1).astype(np.int64)
+
+		summary = {
+			'pcb' : np.repeat(codes, number_of_groups),
+			'female' : np.tile(np.repeat([False, True], number_of_bins), len(codes)),
+			'min_age' : np.tile(bin_edges[:-1], 2 * len(codes)),
+			'max_age' : np.tile(bin_edges[1:] - 1, 2 * len(codes)),
+			'percentile_levels' : percentiles,
+		}
+		counts = []
+		median_ages = []
+		values = []
+		intervals = []
+		rng = np.random.RandomState(seed)
+		for i, code in enumerate(codes):
+			rows = (group >= 0) & ~np.isnan(concentrations[i])
+			count = np.bincount(group[rows], minlength=number_of_groups)
+			counts.append(count)
+			median_ages.append(self.grouped_percentiles(group[rows], ages[rows], count, [50.0])[:, 0])
+			values.append(self.grouped_percentiles(group[rows], concentrations[i][rows], count, percentiles))
+			if replicates > 0:
+				order = np.argsort(group[rows], kind='mergesort')
+				groups = np.split(concentrations[i][rows][order], np.cumsum(count)[:-1])
+				intervals.append([bootstrap_confidence_interval(c, np.median, replicates, confidence, rng, chunk_size) for c in groups])
+		if replicates > 0:
+			summary['median_ci'] = np.array(intervals, dtype=np.float64).reshape(-1, 2)
+		summary['count'] = np.concatenate(counts) if counts else np.empty(0, dtype=np.int64)
+		summary['median_age'] = np.concatenate(median_ages) if median_ages else np.empty(0)
+		summary['percentiles'] = np.concatenate(values) if values else np.empty((0, len(percentiles)))
+		return summary
+
 	# Private Methods below this line.
 
+	def get_seqn_array(self):
+		# SEQN numbers in the same order as the arrays of get_arrays_for_codes.
+		if self.columnar:
+			return np.asarray(self.data.seqn)
+		return np.array(list(self.data.keys()), dtype=np.int64)
+
+	def get_arrays_for_codes(self, codes):
+		# ages, genders and one concentration array per NHANES code, NaN where missing.
+		if self.columnar:
+			ages = np.where(self.data.mask(s.AGE_CODE), self.data.column(s.AGE_CODE), np.nan)
+			genders = np.where(self.data.mask(s.GENDER_CODE), self.data.column(s.GENDER_CODE), 0)
+			concentrations = [np.where(self.data.mask(code), self.data.column(code), np.nan) for code in codes]
+			return ages, genders, concentrations
+
+		rows = list(self.data.values())
+		ages = np.array([row.get(s.AGE_CODE, np.nan) for row in rows], dtype=np.float64)
+		genders = np.array([row.get(s.GENDER_CODE, 0) for row in rows], dtype=np.int64)
+		concentrations = [np.array([row.get(code, np.nan) for row in rows], dtype=np.float64) for code in codes]
+		return ages, genders, concentrations
+
+	def grouped_percentiles(self, group, values, count, percentiles):
+		# percentiles (linear interpolation, like np.percentile) of the values in every group,
+		# from one sort of the values by group. Empty groups are NaN.
+		order = np.lexsort((values, group))
+		values = values[order]
+		start = np.concatenate(([0], np.cumsum(count)[:-1]))
+		position = (np.asarray(percentiles)[np.newaxis, :] / 100.0) * np.maximum(count - 1, 0)[:, np.newaxis]
+		lower = np.floor(position).astype(np.int64)
+		upper = np.minimum(lower + 1, np.maximum(count - 1, 0)[:, np.newaxis])
+		if not len(values):
+			return np.full(position.shape, np.nan)
+		low = values[np.minimum(start[:, np.newaxis] + lower, len(values) - 1)]
+		high = values[np.minimum(start[:, np.newaxis] + upper, len(values) - 1)]
+		ret = low + (position - lower) * (high - low)
+		ret[count == 0] = np.nan
+		return ret
+
 	def gender_number_if_female(self, female):
 		return 2 if female else 1
 
+	def rows_for_pcb_for_gender(self, pcb_string, female, min_age = None, max_age = None, with_age = False):
+		# positions (in SEQN order) of the respondents with a measurement for the PCB, of the requested gender,
+		# aged min_age to max_age if given, resolved from the secondary indexes.
+		return self.index.rows(pcb_string, self.gender_number_if_female(female), min_age, max_age, with_age)
+
+	def seqn_for_pcb_for_gender(self, pcb_string, female, min_age = None, max_age = None, with_age = False):
+		# rows_for_pcb_for_gender as a list of SEQN numbers.
+		return self.index.seqn[self.rows_for_pcb_for_gender(pcb_string, female, min_age, max_age, with_age)].tolist()
+
+	def build_index(self):
+		# secondary indexes over the respondents, in the order of get_seqn_array.
+		with measure(self.stats, 'SWNhanesReader.build_index') as phase:
+			if self.columnar:
+				masks = self.data.masks
+			else:
+				positions = {}
+				for i, row in enumerate(self.data.values()):
+					for var in row:
+						positions.setdefault(var, []).append(i)
+				masks = {}
+				for var, rows in positions.items():
+					masks[var] = np.zeros(len(self.data), dtype=bool)
+					masks[var][rows] = True
+			ages, genders, concentrations = self.get_arrays_for_codes([])
+			index = SWNhanesIndex(self.get_seqn_array(), masks, genders, ages)
+			phase.rows, phase.cells = len(index), len(index.presence)
+		return index
+
+	def selected_variables(self, variables):
+		# NHANES codes of the variables to read, with the age and gender every query depends on. None reads everything.
+		if variables is None:
+			return None
+		return sorted(set(self.get_nhanes_code(var) for var in variables) | set([s.AGE_CODE, s.GENDER_CODE]))
+
+	def get_nhanes_code(self, var):
+		# NHANES code for a variable name, or for a PCB congener such as 'PCB-153' or 153.
+		if isinstance(var, int) or str(var).upper().startswith('PCB'):
+			return self.get_nhanes_code_for_pcb(var)
+		return str(var).upper()
+
 	def get_nhanes_code_for_pcb(self, pcb):
 		# This method is designed to take any kind of string input (or int maybe)
 		# and turn it into the code used in the NHANES data.
@@ -165,17 +371,44 @@ class SWNhanesReader(object):
 		start_row = 1
 		header_row = 0
 
-		filenames = [os.path.join(s.NHANES_DATA_PATH, self.folders_dict[self.nhanes_year], name) for name in self.filenames_dict[self.nhanes_year]]
+		filenames = self.component_filenames()
+
+		if self.cache:
+			with measure(self.stats, 'SWNhanesReader.load_cache') as phase:
+				table = self.load_cached_table()
+				phase.rows = len(table) if table is not None else 0
+			if table is not None:
+				return table
+
+		if self.columnar or self.processes != 1:
+			# every file is parsed into typed columns (in parallel if asked), then merged on SEQN.
+			with measure(self.stats, 'SWNhanesReader.parse_components') as phase:
+				components = self.parse_components(filenames, self.diet_filename() if self.READ_DIETARY_INFO else None)
+				for file_seqn, columns in components:
+					phase.rows += len(file_seqn)
+					phase.cells += len(file_seqn) * len(columns)
+					phase.failures += sum(int(np.count_nonzero(~present)) for header, values, present in columns)
+			food_component = components.pop() if self.READ_DIETARY_INFO else None
+			if not self.columnar:
+				with measure(self.stats, 'SWNhanesReader.create_dict') as phase:
+					ret_dict = self.create_dict(components, food_component)
+					phase.rows = len(ret_dict)
+				return ret_dict
+			with measure(self.stats, 'SWNhanesReader.create_table') as phase:
+				table = self.create_table(components, food_component)
+				phase.rows, phase.cells = len(table), len(table) * len(table.columns)
+			if self.cache:
+				with measure(self.stats, 'SWNhanesReader.write_cache') as phase:
+					self.write_cached_table(table)
+					phase.rows, phase.cells = len(table), len(table) * len(table.columns)
+			return table
 
 		imported_data = []
 
-		for f in filenames:
-			file_import_temp = []
-			with open(f, 'rU') as csvfile:
-				temp = csv.reader(csvfile, delimiter = ',', quotechar = '"')
-				for row in temp:
-					file_import_temp.append(row)
-			imported_data.append(file_import_temp)
+		with measure(self.stats, 'SWNhanesReader.read_csv') as phase:
+			for f in filenames:
+				imported_data.append(self.read_csv(f, start_column))
+				phase.rows += len(imported_data[-1])
 
 		if imported_data:
 			if imported_data[0]:
@@ -183,15 +416,20 @@ class SWNhanesReader(object):
 					seqn = int(row[seqn_column])
 					ret_dict.update({seqn : {} })
 
-		for f in imported_data:
-			for row in f[start_row:]:
-				seqn = int(row[seqn_column])
-				for i, header in enumerate(f[header_row][start_column:]):
-					header = header.upper()
-					column = i + start_column
-					try: val = self.cast(header)(row[column])
-					except ValueError: continue
-					ret_dict[seqn].update({header : val})
+		with measure(self.stats, 'SWNhanesReader.cast') as phase:
+			for f in imported_data:
+				for row in f[start_row:]:
+					seqn = int(row[seqn_column])
+					phase.rows += 1
+					for i, header in enumerate(f[header_row][start_column:]):
+						header = header.upper()
+						column = i + start_column
+						phase.cells += 1
+						try: val = self.cast(header)(row[column])
+						except ValueError:
+							phase.failures += 1
+							continue
+						ret_dict[seqn].update({header : val})
 
 		# special read in for diet info
 		if self.READ_DIETARY_INFO:
@@ -200,30 +438,258 @@ class SWNhanesReader(object):
 			# f = [os.path.join(s.NHANES_DATA_PATH, self.folders_dict[self.nhanes_year], fn) for fn in diet_filename_dict[self.nhanes_year]]
 
 			food_number_column = 2
-			raw = []
 
 			for seqn in ret_dict:
 				ret_dict[seqn].update({'food_index' : {} })
 
-			with open(f, 'rU') as csvfile:
-				temp = csv.reader(csvfile, delimiter = ',', quotechar = '"')
-				for row in temp:
-					raw.append(row)
-			for row in raw[start_row:]:
-				seqn = int(row[seqn_column])
-				food_index = int(row[food_number_column])
-				ret_dict[seqn]['food_index'].update({food_index : {}})
-				for i, header in enumerate(raw[header_row][3:]):
-					header = header.upper().replace('DRX', 'DR1')
-					column = i + 3
-					#print 'brool'
-					try: val = self.cast(header)(row[column])
-					except ValueError: continue
-					ret_dict[seqn]['food_index'][food_index].update({header : val})
+			with measure(self.stats, 'SWNhanesReader.read_diet') as phase:
+				raw = self.read_csv(f, food_number_column + 1, self.diet_header)
+				for row in raw[start_row:]:
+					seqn = int(row[seqn_column])
+					food_index = int(row[food_number_column])
+					ret_dict[seqn]['food_index'].update({food_index : {}})
+					phase.rows += 1
+					for i, header in enumerate(raw[header_row][3:]):
+						header = self.diet_header(header)
+						column = i + 3
+						#print 'brool'
+						phase.cells += 1
+						try: val = self.cast(header)(row[column])
+						except ValueError:
+							phase.failures += 1
+							continue
+						ret_dict[seqn]['food_index'][food_index].update({header : val})
 
 		
 		return ret_dict
 
+	def create_table(self, components, food_component = None):
+		# Columnar version of obtain_data.
+		# One typed array per variable, aligned on the sorted SEQN numbers of the first file.
+		seqn = np.unique(components[0][0]) if components else np.empty(0, dtype=np.int64)
+		table = SWNhanesTable(seqn)
+
+		for file_seqn, columns in components:
+			rows = np.clip(np.searchsorted(seqn, file_seqn), 0, max(len(seqn) - 1, 0))
+			known = seqn[rows] == file_seqn if len(seqn) else np.zeros(len(file_seqn), dtype=bool)
+			for header, values, present in columns:
+				table.set_column(header, rows, values, present & known)
+
+		if food_component is not None:
+			record_seqn, columns = food_component
+			order = np.argsort(record_seqn, kind='mergesort')
+			food = SWNhanesTable(record_seqn[order])
+			rows = np.arange(len(record_seqn))
+			for header, values, present in columns:
+				food.set_column(header, rows, values[order], present[order])
+			table.food = food
+
+		return table
+
+	def create_dict(self, components, food_component = None):
+		# obtain_data's dict of dicts, built from typed columns.
+		ret_dict = dict((seqn, {}) for seqn in components[0][0].tolist()) if components else {}
+
+		for file_seqn, columns in components:
+			for header, values, present in columns:
+				for seqn, val in zip(file_seqn[present].tolist(), values[present].tolist()):
+					ret_dict[seqn].update({header : val})
+
+		if food_component is not None:
+			for seqn in ret_dict:
+				ret_dict[seqn].update({'food_index' : {} })
+			record_seqn, columns = food_component
+			food_index = columns[0][1].tolist() # the food number column comes first
+			for seqn, index in zip(record_seqn.tolist(), food_index):
+				ret_dict[seqn]['food_index'].update({index : {}})
+			for header, values, present in columns[1:]:
+				for i in np.flatnonzero(present).tolist():
+					ret_dict[record_seqn[i].item()]['food_index'][food_index[i]].update({header : values[i].item()})
+
+		return ret_dict
+
+	def parse_components(self, filenames, diet_filename = None):
+		# parse_component for every file, in a process pool if processes is not 1.
+		jobs = [(self, f, False) for f in filenames]
+		if diet_filename is not None:
+			jobs.append((self, diet_filename, True))
+		if self.processes == 1 or len(jobs) < 2:
+			return [_parse_component(job) for job in jobs]
+		pool = multiprocessing.Pool(self.processes)
+		try:
+			return pool.map(_parse_component, jobs)
+		finally:
+			pool.close()
+			pool.join()
+
+	def parse_component(self, filename, diet = False):
+		# parse one csv file into typed columns: (seqn array, [(variable, values, present), ...]).
+		# The dietary file also gets a 'food_index' column from its food number column.
+		seqn_column = 1
+		food_number_column = 2
+		fixed_columns = food_number_column + 1 if diet else seqn_column + 1
+		rename = self.diet_header if diet else (lambda header: header.upper())
+
+		raw = self.read_csv(filename, fixed_columns, rename if diet else None)
+		header, rows = raw[0], [row for row in raw[1:] if row]
+		seqn = np.array([int(row[seqn_column]) for row in rows], dtype=np.int64)
+		columns = []
+		if diet:
+			values, present = self.typed_column('food_index', [row[food_number_column] for row in rows], int)
+			columns.append(('food_index', values, present))
+		for i in range(fixed_columns, len(header)):
+			var = rename(header[i])
+			values, present = self.typed_column(var, [row[i] for row in rows])
+			columns.append((var, values, present))
+		return seqn, columns
+
+	def typed_column(self, header, strings, cast = None):
+		# cast the strings of one column with the type_dict rules.
+		# Returns the typed values and a mask that is False where the cast failed.
+		cast = cast or self.cast(header)
+		dtype = {int : np.int64, float : np.float64}.get(cast)
+		if dtype is None:
+			return np.array(strings, dtype=str), np.ones(len(strings), dtype=bool)
+		values = np.zeros(len(strings), dtype=dtype)
+		if dtype == np.float64:
+			values[:] = np.nan
+		present = np.zeros(len(strings), dtype=bool)
+		for i, string in enumerate(strings):
+			try: values[i] = cast(string)
+			except ValueError: continue
+			present[i] = True
+		return values, present
+
+	def component_filenames(self):
+		# the component csv files to read. The first one (demographics) is always read, it lists every respondent.
+		# The others are skipped when variables are selected and their header has none of them.
+		seqn_column = 1
+		folder = os.path.join(s.NHANES_DATA_PATH, self.folders_dict[self.nhanes_year])
+		filenames = [os.path.join(folder, name) for name in self.filenames_dict[self.nhanes_year]]
+		if self.variables is None:
+			return filenames
+		return filenames[:1] + [f for f in filenames[1:] if len(self.selected_columns(self.read_header(f), seqn_column + 1)) > seqn_column + 1]
+
+	def source_filenames(self):
+		# every csv file that goes into the data, in reading order.
+		filenames = self.component_filenames()
+		if self.READ_DIETARY_INFO:
+			filenames.append(os.path.join(s.NHANES_DATA_PATH, self.folders_dict[self.nhanes_year], self.diet_filename_dict[self.nhanes_year]))
+		return filenames
+
+	def read_header(self, filename):
+		with open(filename, 'rU') as csvfile:
+			return next(csv.reader(csvfile, delimiter = ',', quotechar = '"'), [])
+
+	def read_csv(self, filename, fixed_columns, rename = None):
+		# read a csv file into a list of rows.
+		# When variables are selected only the first fixed_columns (row name, SEQN, ...) and the selected variables are kept.
+		with open(filename, 'rU') as csvfile:
+			temp = csv.reader(csvfile, delimiter = ',', quotechar = '"')
+			header = next(temp, [])
+			if self.variables is None:
+				return [header] + [row for row in temp]
+			keep = self.selected_columns(header, fixed_columns, rename)
+			return [[header[i] for i in keep]] + [[row[i] for i in keep] for row in temp]
+
+	def selected_columns(self, header, fixed_columns, rename = None):
+		# indices of the fixed columns plus the columns of the selected variables.
+		rename = rename or (lambda header: header.upper())
+		return list(range(min(fixed_columns, len(header)))) + [i for i in range(fixed_columns, len(header)) if rename(header[i]) in self.variables]
+
+	def diet_filename(self):
+		return os.path.join(s.NHANES_DATA_PATH, self.folders_dict[self.nhanes_year], self.diet_filename_dict[self.nhanes_year])
+
+	def food_record_from_strings(self, header, row):
+		# (seqn, food number, {variable : value}) from one row of the dietary individual foods file.
+		seqn_column = 1
+		food_number_column = 2
+		record = {}
+		for i in range(food_number_column + 1, len(header)):
+			var = self.diet_header(header[i])
+			if self.variables is not None and var not in self.variables:
+				continue
+			try: record[var] = self.cast(var)(row[i])
+			except ValueError: continue
+		return (int(row[seqn_column]), int(row[food_number_column]), record)
+
+	def diet_header(self, header):
+		# the 1999-2000 and 2001-2002 dietary codes start with DRX instead of DR1.
+		return header.upper().replace('DRX', 'DR1')
+
+	def cache_key(self):
+		# what the parsed table depends on: the cycle, the files and the casting rules.
+		return {
+			'version' : self.CACHE_VERSION,
+			'nhanes_year' : self.nhanes_year,
+			'files' : [os.path.basename(f) for f in self.source_filenames()],
+			'type_dict' : sorted((var, cast.__name__) for var, cast in type_dict.items()),
+			'variables' : self.variables,
+		}
+
+	def cache_folder(self):
+		key = json.dumps(self.cache_key(), sort_keys = True)
+		return os.path.join(s.NHANES_DATA_PATH, self.folders_dict[self.nhanes_year], self.CACHE_FOLDER, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+	def source_stats(self):
+		return [[os.path.getsize(f), os.stat(f).st_mtime] for f in self.source_filenames()]
+
+	def load_cached_table(self):
+		# memory-map the cached table, or None if there is none or a source file changed.
+		folder = self.cache_folder()
+		try:
+			with open(os.path.join(folder, 'manifest.json')) as f:
+				manifest = json.load(f)
+			if manifest['key'] != json.loads(json.dumps(self.cache_key())) or manifest['stats'] != self.source_stats():
+				return None
+			table = self.load_table(folder, manifest['table'])
+			if manifest['food'] is not None:
+				table.food = self.load_table(folder, manifest['food'])
+		except (IOError, OSError, ValueError, KeyError):
+			return None
+		return table
+
+	def load_table(self, folder, entry):
+		load = lambda name: np.load(os.path.join(folder, name), mmap_mode = 'r')
+		table = SWNhanesTable(load(entry['seqn']))
+		for var, (column, mask) in entry['columns'].items():
+			table.columns[str(var)] = load(column)
+			table.masks[str(var)] = load(mask)
+		return table
+
+	def write_cached_table(self, table):
+		# save every array of the table as .npy files plus a manifest. Failing to write the cache is not fatal.
+		folder = self.cache_folder()
+		temp_folder = folder + '.tmp'
+		try:
+			if os.path.exists(temp_folder):
+				shutil.rmtree(temp_folder)
+			os.makedirs(temp_folder)
+			manifest = {
+				'key' : self.cache_key(),
+				'stats' : self.source_stats(),
+				'table' : self.save_table(temp_folder, 'table', table),
+				'food' : self.save_table(temp_folder, 'food', table.food) if table.food is not None else None,
+			}
+			with open(os.path.join(temp_folder, 'manifest.json'), 'w') as f:
+				json.dump(manifest, f)
+			if os.path.exists(folder):
+				shutil.rmtree(folder)
+			os.rename(temp_folder, folder)
+		except (IOError, OSError):
+			if os.path.exists(temp_folder):
+				shutil.rmtree(temp_folder, ignore_errors = True)
+
+	def save_table(self, folder, prefix, table):
+		entry = {'seqn' : prefix + '_seqn.npy', 'columns' : {}}
+		np.save(os.path.join(folder, entry['seqn']), table.seqn)
+		for i, var in enumerate(sorted(table.columns)):
+			column, mask = '%s_%d.npy' % (prefix, i), '%s_%d_mask.npy' % (prefix, i)
+			np.save(os.path.join(folder, column), table.columns[var])
+			np.save(os.path.join(folder, mask), table.masks[var])
+			entry['columns'][var] = [column, mask]
+		return entry
+
 	# Dictionaries containing the appropriate file names.
 	filenames_dict = {
 		'2003-2004' : ['DEMO_C.csv', 'RHQ_C.csv', 'L28NPB_C.csv', 'BMX_C.csv', 'L28DFP_C.csv', 'DR1TOT_C.csv'],
@@ -242,3 +708,356 @@ class SWNhanesReader(object):
 		'2001-2002' : 'NHANES data 2001-2002',
 		'1999-2000' : 'NHANES data 1999-2000'
 	}
+
+
+def bootstrap_confidence_interval(values, statistic = np.median, replicates = 1000, confidence = 95, seed = None, chunk_size = None):
+	# percentile bootstrap confidence interval of statistic(values).
+	# All the replicates of a chunk are drawn as one (chunk_size x n) index matrix and
+	# the statistic is computed along axis 1, so statistic must accept an axis argument.
+	# seed is an int or a np.random.RandomState; chunk_size (replicates per chunk) bounds the memory used.
+	values = np.asarray(values, dtype=np.float64)
+	n = len(values)
+	if n == 0 or replicates <= 0:
+		return (np.nan, np.nan)
+	rng = seed if isinstance(seed, np.random.RandomState) else np.random.RandomState(seed)
+	chunk_size = chunk_size or max(1, 2 ** 22 // n) # about 32 MB of float64 per chunk by default
+	results = np.empty(replicates)
+	for start in range(0, replicates, chunk_size):
+		stop = min(start + chunk_size, replicates)
+		index = rng.randint(0, n, size = (stop - start, n))
+		results[start:stop] = statistic(values[index], axis = 1)
+	alpha = (100.0 - confidence) / 2.0
+	lower, upper = np.percentile(results, [alpha, 100.0 - alpha])
+	return (lower, upper)
+
+def _parse_component(job):
+	# process pool worker for SWNhanesReader.parse_components
+	reader, filename, diet = job
+	return reader.parse_component(filename, diet)
+
+def _load_cycle(job):
+	# process pool worker for load_cycles, files are parsed serially inside each worker.
+	# With cache the worker only writes the cache and returns the cycle, the parent memory-maps it.
+	nhanes_year, kwargs = job
+	reader = SWNhanesReader(nhanes_year, **dict(kwargs, processes = 1))
+	if kwargs.get('cache'):
+		return nhanes_year
+	return reader
+
+def load_cycles(nhanes_years = ('1999-2000', '2001-2002', '2003-2004'), processes = None, **kwargs):
+	# load several NHANES cycles concurrently, one process per cycle.
+	# kwargs are passed on to every SWNhanesReader. Returns {nhanes_year : reader}.
+	jobs = [(nhanes_year, kwargs) for nhanes_year in nhanes_years]
+	if processes == 1 or len(jobs) < 2:
+		return dict((nhanes_year, SWNhanesReader(nhanes_year, **dict(kwargs, processes = 1))) for nhanes_year in nhanes_years)
+	pool = multiprocessing.Pool(processes or len(jobs))
+	try:
+		loaded = pool.map(_load_cycle, jobs)
+	finally:
+		pool.close()
+		pool.join()
+	# a cached table sent back through the pool would arrive as a private copy, so it is opened here instead.
+	return dict((nhanes_year, SWNhanesReader(nhanes_year, **dict(kwargs, processes = 1)) if kwargs.get('cache') else reader) for nhanes_year, reader in zip(nhanes_years, loaded))
+
+class SWNhanesPanel(SWNhanesReader):
+	"""docstring for SWNhanesPanel
+
+	Several NHANES cycles merged into one columnar table,
+	with a CYCLE column and harmonized variable names, so the
+	SWNhanesReader queries run across all cycles in one call.
+	The dietary data is not part of the panel.
+	"""
+
+	CYCLE_CODE = 'CYCLE'
+	ALL_CYCLES = ('1999-2000', '2001-2002', '2003-2004')
+
+	def __init__(self, nhanes_years = ALL_CYCLES, cache = False, variables = None, processes = None, stats = None):
+		self.nhanes_years = list(nhanes_years)
+		super(SWNhanesPanel, self).__init__(None, diet = False, columnar = True, cache = cache, variables = variables, processes = processes, stats = stats)
+
+	def food_records_for_seqn(self, seqn):
+		raise Exception('Error, the panel has no dietary data, use an SWNhanesReader of one cycle with diet = True')
+
+	def iter_food_records(self, chunk_size = 10000):
+		raise Exception('Error, the panel has no dietary data, use an SWNhanesReader of one cycle with diet = True')
+
+	def obtain_data(self):
+		# the cycles are loaded (concurrently) and stacked into one table instead of reading one cycle.
+		with measure(self.stats, 'SWNhanesPanel.load_cycles') as phase:
+			readers = load_cycles(self.nhanes_years, self.processes, columnar = True, cache = self.cache, variables = self.cycle_variables())
+			phase.rows = sum(len(reader.data) for reader in readers.values())
+		with measure(self.stats, 'SWNhanesPanel.merge_tables') as phase:
+			table = self.merge_tables([readers[nhanes_year].data for nhanes_year in self.nhanes_years], self.nhanes_years)
+			phase.rows, phase.cells = len(table), len(table) * len(table.columns)
+		return table
+
+	def harmonized_name(self, var):
+		# the name a variable gets in the panel. The 1999-2000 and 2001-2002 dietary codes start with DRX instead of DR1.
+		return 'DR1' + var[3:] if var.startswith('DRX') else var
+
+	def cycle_variables(self):
+		# the variables to read from each cycle, including the older names of harmonized variables.
+		if self.variables is None:
+			return None
+		return self.variables + ['DRX' + var[3:] for var in self.variables if var.startswith('DR1')]
+
+	def merge_tables(self, tables, nhanes_years):
+		# stack the cycle tables, sorted on SEQN (then cycle).
+		seqn = np.concatenate([table.seqn for table in tables]) if tables else np.empty(0, dtype=np.int64)
+		cycle = np.concatenate([np.repeat(np.array([nhanes_year], dtype=str), len(table)) for table, nhanes_year in zip(tables, nhanes_years)]) if tables else np.empty(0, dtype=str)
+		order = np.lexsort((cycle, seqn))
+		panel = SWNhanesTable(seqn[order])
+		all_rows = np.arange(len(seqn))
+		panel.set_column(self.CYCLE_CODE, all_rows, cycle[order], np.ones(len(seqn), dtype=bool))
+
+		start = 0
+		position = np.empty(len(seqn), dtype=np.int64)
+		position[order] = all_rows # where each stacked row ends up in the panel
+		for table in tables:
+			rows = position[start:start + len(table)]
+			for var in table.columns:
+				panel.set_column(self.harmonized_name(var), rows, np.asarray(table.columns[var]), np.asarray(table.masks[var]))
+			start += len(table)
+		return panel
+
+	def cycle_rows(self, nhanes_years):
+		# boolean mask of the respondents from the given cycle(s).
+		if isinstance(nhanes_years, str):
+			nhanes_years = [nhanes_years]
+		return np.in1d(self.data.column(self.CYCLE_CODE), np.array(nhanes_years, dtype=str))
+
+	def for_cycles(self, nhanes_years):
+		# a panel restricted to some cycles, all queries then only use those respondents.
+		panel = copy.copy(self)
+		panel.data = self.data.take(self.cycle_rows(nhanes_years))
+		panel.index = panel.build_index()
+		panel.nhanes_years = [nhanes_year for nhanes_year in self.nhanes_years if nhanes_year in nhanes_years]
+		return panel
+
+	@instrumented
+	def get_cycle_age_and_concentration_for_pcb_for_gender(self, pcb, female):
+		# like get_age_and_concentration_for_pcb_for_gender, with the cycle of every respondent.
+		pcb_string = self.get_nhanes_code_for_pcb(pcb)
+		rows = self.rows_for_pcb_for_gender(pcb_string, female, with_age = True)
+		return [self.data.column(self.CYCLE_CODE)[rows], self.data.column(s.AGE_CODE)[rows], self.data.column(pcb_string)[rows]]
+
+class SWNhanesTable(object):
+	"""docstring for SWNhanesTable
+
+	Columnar storage for NHANES data. seqn is sorted and every
+	variable is one typed array aligned on it, with a boolean
+	mask that is False where the respondent has no value.
+	Missing floats are also NaN.
+	"""
+
+	def __init__(self, seqn):
+		super(SWNhanesTable, self).__init__()
+		self.seqn = np.asarray(seqn, dtype=np.int64)
+		self.columns = {}
+		self.masks = {}
+		self.food = None # food records when the dietary data is read, one row per record
+
+	def __contains__(self, var):
+		return var in self.columns
+
+	def __len__(self):
+		return len(self.seqn)
+
+	def column(self, var):
+		if var not in self.columns:
+			return np.full(len(self.seqn), np.nan)
+		return self.columns[var]
+
+	def mask(self, var):
+		if var not in self.masks:
+			return np.zeros(len(self.seqn), dtype=bool)
+		return self.masks[var]
+
+	def rows_for_seqn(self, seqn):
+		# slice of the rows belonging to a SEQN (one row for respondents, many for food records).
+		return slice(np.searchsorted(self.seqn, seqn, side='left'), np.searchsorted(self.seqn, seqn, side='right'))
+
+	def value(self, seqn, var):
+		rows = self.rows_for_seqn(seqn)
+		if rows.stop - rows.start != 1 or not self.mask(var)[rows.start]:
+			return None
+		return self.columns[var][rows.start].item()
+
+	def take(self, rows):
+		# a new table with only the given rows (a boolean mask or indices).
+		table = SWNhanesTable(self.seqn[rows])
+		for var in self.columns:
+			table.columns[var] = self.columns[var][rows]
+			table.masks[var] = self.masks[var][rows]
+		return table
+
+	def set_column(self, var, rows, values, present):
+		# write the present values into the rows, a later file overwrites an earlier one.
+		rows = rows[present]
+		if var not in self.columns:
+			self.columns[var] = np.zeros(len(self.seqn), dtype=values.dtype)
+			if values.dtype == np.float64:
+				self.columns[var][:] = np.nan
+			self.masks[var] = np.zeros(len(self.seqn), dtype=bool)
+		elif self.columns[var].dtype != values.dtype:
+			self.columns[var] = self.columns[var].astype(np.result_type(self.columns[var], values))
+			if self.columns[var].dtype == np.float64:
+				self.columns[var][~self.masks[var]] = np.nan
+		self.columns[var][rows] = values[present]
+		self.masks[var][rows] = True
+
+
+class SWNhanesIndex(object):
+	"""docstring for SWNhanesIndex
+
+	Secondary indexes over the respondents of an SWNhanesReader:
+	a presence bitmap (np.packbits) per variable, one bitmap per
+	gender and the respondents with an age sorted by age.
+	A variable/gender/age range subset is resolved by intersecting
+	bitmaps and a binary search on the ages. The rows of a bitmap
+	are decoded once and kept, so a query without an age range
+	returns them directly and one with an age range only tests
+	the respondents in that range, never every respondent.
+	Rows are positions in seqn, in ascending order.
+	"""
+
+	def __init__(self, seqn, masks, genders, ages):
+		super(SWNhanesIndex, self).__init__()
+		self.seqn = np.asarray(seqn)
+		self.presence = dict((var, np.packbits(np.asarray(mask, dtype=bool))) for var, mask in masks.items())
+		self.genders = dict((gender, np.packbits(genders == gender)) for gender in (1, 2))
+		with_age = np.flatnonzero(~np.isnan(ages))
+		self.age_order = with_age[np.argsort(ages[with_age], kind='mergesort')]
+		self.sorted_ages = ages[self.age_order]
+		self.bitmaps = {} # intersections already computed, {(var, gender) : bitmap}
+		self.bitmap_rows = {} # the same intersections decoded, {(var, gender, with_age) : rows}
+
+	def __len__(self):
+		return len(self.seqn)
+
+	def bitmap(self, var, gender = None):
+		# presence bitmap of var, intersected with the gender's bitmap if given.
+		key = (var, gender)
+		if key not in self.bitmaps:
+			bitmap = self.presence.get(var)
+			if bitmap is None:
+				bitmap = np.zeros((len(self) + 7) // 8, dtype=np.uint8)
+			if gender is not None:
+				bitmap = bitmap & self.genders.get(gender, np.zeros_like(bitmap))
+			self.bitmaps[key] = bitmap
+		return self.bitmaps[key]
+
+	def rows(self, var, gender = None, min_age = None, max_age = None, with_age = False):
+		# respondents with var (of the gender, aged min_age to max_age inclusive if given).
+		# with_age keeps only respondents with an age even without age limits.
+		if min_age is None and max_age is None:
+			key = (var, gender, with_age)
+			if key not in self.bitmap_rows:
+				if with_age:
+					rows = self.rows_in_age_range(var, gender, None, None)
+				else:
+					rows = np.flatnonzero(np.unpackbits(self.bitmap(var, gender))[:len(self)])
+				rows.setflags(write=False) # shared by every later query
+				self.bitmap_rows[key] = rows
+			return self.bitmap_rows[key]
+		return self.rows_in_age_range(var, gender, min_age, max_age)
+
+	def rows_in_age_range(self, var, gender, min_age, max_age):
+		# respondents with var (of the gender) and an age from min_age to max_age, from the age order.
+		bitmap = self.bitmap(var, gender)
+		start = 0 if min_age is None else np.searchsorted(self.sorted_ages, min_age, side='left')
+		end = len(self.sorted_ages) if max_age is None else np.searchsorted(self.sorted_ages, max_age, side='right')
+		candidates = self.age_order[start:max(start, end)]
+		found = (bitmap[candidates >> 3] >> (7 - (candidates & 7))) & 1
+		return np.sort(candidates[found.astype(bool)])
+
+class SWNhanesFoodIndex(object):
+	"""docstring for SWNhanesFoodIndex
+
+	Lazy access to a dietary individual foods file (DR1IFF/DRXIFF).
+	The file is scanned once for the byte ranges that hold each
+	respondent's food records, and the index is saved next to the
+	file. Records are only parsed for the SEQN numbers asked for.
+	"""
+
+	INDEX_EXTENSION = '.swindex.npz'
+
+	def __init__(self, filename, reader):
+		super(SWNhanesFoodIndex, self).__init__()
+		self.filename = filename
+		self.reader = reader # parses the rows with food_record_from_strings
+		with open(filename, 'rU') as csvfile:
+			self.header = next(csv.reader(csvfile, delimiter = ',', quotechar = '"'), [])
+		self.seqn, self.start, self.end = self.load_index()
+
+	def records_for_seqn(self, seqn):
+		# {food number : {variable : value}} for one respondent, empty if they have no records.
+		i = np.searchsorted(self.seqn, seqn)
+		records = {}
+		if i == len(self.seqn) or self.seqn[i] != seqn:
+			return records
+		with open(self.filename, 'rb') as f:
+			while i < len(self.seqn) and self.seqn[i] == seqn:
+				for record_seqn, food_index, record in self.parse(f, self.start[i], self.end[i]):
+					records[food_index] = record
+				i += 1
+		return records
+
+	def iter_records(self, chunk_size = 10000):
+		# stream the whole file in chunks of at most chunk_size parsed records.
+		with open(self.filename, 'rU') as csvfile:
+			temp = csv.reader(csvfile, delimiter = ',', quotechar = '"')
+			next(temp, None)
+			chunk = []
+			for row in temp:
+				if not row:
+					continue
+				chunk.append(self.reader.food_record_from_strings(self.header, row))
+				if len(chunk) >= chunk_size:
+					yield chunk
+					chunk = []
+			if chunk:
+				yield chunk
+
+	def parse(self, f, start, end):
+		f.seek(start)
+		lines = f.read(end - start).splitlines()
+		return [self.reader.food_record_from_strings(self.header, row) for row in csv.reader(lines, delimiter = ',', quotechar = '"') if row]
+
+	def source_stats(self):
+		return np.array([os.path.getsize(self.filename), os.stat(self.filename).st_mtime])
+
+	def load_index(self):
+		# the saved index if it is still valid, otherwise scan the file and save it.
+		index_filename = self.filename + self.INDEX_EXTENSION
+		try:
+			saved = np.load(index_filename)
+			if np.array_equal(saved['stats'], self.source_stats()):
+				return saved['seqn'], saved['start'], saved['end']
+		except (IOError, OSError, ValueError, KeyError):
+			pass
+		seqn, start, end = self.scan()
+		try:
+			with open(index_filename, 'wb') as f:
+				np.savez(f, seqn = seqn, start = start, end = end, stats = self.source_stats())
+		except (IOError, OSError):
+			pass
+		return seqn, start, end
+
+	def scan(self):
+		# one pass over the file: byte range of every run of rows with the same SEQN.
+		seqn_column = 1
+		runs = []
+		with open(self.filename, 'rb') as f:
+			offset = len(f.readline())
+			for line in iter(f.readline, b''):
+				if line.strip():
+					seqn = int(line.split(b',')[seqn_column].strip(b'" '))
+					if runs and runs[-1][0] == seqn and runs[-1][2] == offset:
+						runs[-1][2] = offset + len(line)
+					else:
+						runs.append([seqn, offset, offset + len(line)])
+				offset += len(line)
+		runs.sort(key = lambda run: (run[0], run[1]))
+		runs = np.array(runs, dtype = np.int64).reshape(-1, 3)
+		return runs[:, 0], runs[:, 1], runs[:, 2]
@@ -0,0 +1,164 @@
+# SWStats.py
+# Opt-in instrumentation for SWHumanConcentrationReader and SWNhanesReader.
+# Pass stats = SWStats() to a reader to record wall time, rows, cells,
+# conversion failures and peak resident memory for every load phase and public query.
+
+import functools
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+class SWPhaseStats(object):
+	"""docstring for SWPhaseStats
+
+	Totals for one load phase or query method.
+	peak_memory is the largest resident size of the process during a
+	call in kilobytes (the high-water mark VmHWM, reset at the start of
+	the call), the largest of all calls in the totals. None where the
+	high-water mark can not be reset (Linux only).
+	"""
+
+	def __init__(self, name):
+		super(SWPhaseStats, self).__init__()
+		self.name = name
+		self.calls = 0
+		self.seconds = 0.0
+		self.rows = 0
+		self.cells = 0
+		self.failures = 0
+		self.peak_memory = None
+
+	def add(self, other):
+		self.calls += other.calls
+		self.seconds += other.seconds
+		self.rows += other.rows
+		self.cells += other.cells
+		self.failures += other.failures
+		self.add_peak_memory(other.peak_memory)
+
+	def add_peak_memory(self, peak_memory):
+		if peak_memory is not None:
+			self.peak_memory = peak_memory if self.peak_memory is None else max(self.peak_memory, peak_memory)
+
+	def __repr__(self):
+		return 'SWPhaseStats(%s: calls=%d, seconds=%.6f, rows=%d, cells=%d, failures=%d, peak_memory=%s)' % (self.name, self.calls, self.seconds, self.rows, self.cells, self.failures, self.peak_memory)
+
+class SWStats(object):
+	"""docstring for SWStats
+
+	Collects an SWPhaseStats per phase name, in the order the phases first ran.
+	callback(phase_stats) is called after every measured call with the stats of
+	that call alone. One SWStats can be shared by several readers.
+	"""
+
+	def __init__(self, callback=None):
+		super(SWStats, self).__init__()
+		self.callback = callback
+		self.phases = OrderedDict()
+
+	def __getitem__(self, name):
+		return self.phases[name]
+
+	def __contains__(self, name):
+		return name in self.phases
+
+	def __iter__(self):
+		return iter(self.phases.values())
+
+	def __getstate__(self):
+		# readers are pickled into process pools, callbacks often can not be.
+		state = self.__dict__.copy()
+		state['callback'] = None
+		return state
+
+	@contextmanager
+	def measure(self, name):
+		"""time the block, the yielded SWPhaseStats takes its rows, cells and failures"""
+		call = SWPhaseStats(name)
+		call.calls = 1
+		start = time.time()
+		measuring_memory = start_peak_memory()
+		_open_calls.append(call)
+		try:
+			yield call
+		finally:
+			call.seconds = time.time() - start
+			_open_calls.pop()
+			if measuring_memory:
+				end_peak_memory(call)
+			self.phases.setdefault(name, SWPhaseStats(name)).add(call)
+			if self.callback is not None:
+				self.callback(call)
+
+	def report(self):
+		"""the totals as a table, one line per phase"""
+		lines = ['%-70s %8s %12s %12s %12s %10s %12s' % ('phase', 'calls', 'seconds', 'rows', 'cells', 'failures', 'peak memory')]
+		for phase in self:
+			lines.append('%-70s %8d %12.4f %12d %12d %10d %12s' % (phase.name, phase.calls, phase.seconds, phase.rows, phase.cells, phase.failures, phase.peak_memory))
+		return '\n'.join(lines)
+
+_open_calls = [] # calls being measured, outermost first, in every SWStats of the process
+
+def start_peak_memory():
+	# resets the high-water mark of the process for a new call, False when it can not be reset (off Linux).
+	# The peak so far belongs to the calls around this one, so it is handed to them first.
+	peak_memory = high_water_mark()
+	try:
+		with open('/proc/self/clear_refs', 'w') as f:
+			f.write('5')
+	except (IOError, OSError):
+		return False
+	for call in _open_calls:
+		call.add_peak_memory(peak_memory)
+	return peak_memory is not None
+
+def end_peak_memory(call):
+	# the high-water mark since the call started, also counted for the calls around it.
+	peak_memory = high_water_mark()
+	call.add_peak_memory(peak_memory)
+	for outer in _open_calls:
+		outer.add_peak_memory(peak_memory)
+
+def high_water_mark():
+	# peak resident size of the process in kilobytes since the last reset, None off Linux.
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith('VmHWM:'):
+					return int(line.split()[1])
+	except (IOError, OSError, IndexError, ValueError):
+		pass
+	return None
+
+@contextmanager
+def measure(stats, name):
+	"""stats.measure(name), or a throwaway SWPhaseStats when stats is None"""
+	if stats is None:
+		yield SWPhaseStats(name)
+	else:
+		with stats.measure(name) as call:
+			yield call
+
+def instrumented(method):
+	"""decorator timing a public query method when its object has stats, rows counts the values returned"""
+	@functools.wraps(method)
+	def wrapper(self, *args, **kwargs):
+		stats = getattr(self, 'stats', None)
+		if stats is None:
+			return method(self, *args, **kwargs)
+		with stats.measure('%s.%s' % (type(self).__name__, method.__name__)) as call:
+			result = method(self, *args, **kwargs)
+			call.rows = result_size(result)
+		return result
+	return wrapper
+
+def result_size(result):
+	# number of values returned by a query, counted through nested lists and tuples.
+	if isinstance(result, np.ndarray):
+		return result.size
+	if isinstance(result, dict):
+		return len(result)
+	if isinstance(result, (list, tuple)):
+		return sum(result_size(x) for x in result)
+	return 1
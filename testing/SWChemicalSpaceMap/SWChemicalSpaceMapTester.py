@@ -0,0 +1,177 @@
+# Testing the SWChemicalSpaceMap
+
+# This is designed to test that the vectorized phase distribution gives back the partitioning formula
+# and that the maps render to image files without a display, reusing the cached contour paths.
+
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import SWChemicalSpaceMap
+
+matplotlib_imported = 'matplotlib' in sys.modules # importing SWChemicalSpaceMap should not load it
+
+testing_phase_distribution = True;
+testing_render_maps = True;
+testing_adaptive = True;
+
+# air, water and octanol over log KAW (x) and log KOW (y)
+x = np.linspace(-12, 4, 41)
+y = np.linspace(-2, 12, 29)
+volumes = (1.0, 0.001, 0.00001)
+coefficients = [(1, 0, 0), (0, 0, 0), (0, 1, 0)]
+phase_names = ['air', 'water', 'octanol']
+
+def expected_distribution(x_value, y_value):
+	"""the fraction of every phase at one grid point, one phase at a time"""
+	vk = [volume * 10.0 ** (ax * x_value + ay * y_value + c) for volume, (ax, ay, c) in zip(volumes, coefficients)]
+	return [100.0 * v / sum(vk) for v in vk]
+
+if testing_phase_distribution:
+	# Every grid point should match the formula, for any chunk size.
+	error_counter = 0
+	phi = SWChemicalSpaceMap.phase_distribution(x, y, volumes, coefficients)
+	if phi.shape != (len(phase_names), len(y), len(x)):
+		print 'Error! the phase distribution has the shape %s.' % (phi.shape,)
+		error_counter += 1
+	for i in range(0, len(y), 4):
+		for j in range(0, len(x), 5):
+			if not np.allclose(phi[:, i, j], expected_distribution(x[j], y[i])):
+				print 'Error! the phase distribution at (%g, %g) is %s.' % (x[j], y[i], phi[:, i, j])
+				error_counter += 1
+	if not np.allclose(phi.sum(axis=0), 100.0):
+		print 'Error! the phases do not add up to 100%.'
+		error_counter += 1
+	for chunk_size in [1, 7, 1000]:
+		if not np.array_equal(SWChemicalSpaceMap.phase_distribution(x, y, volumes, coefficients, chunk_size), phi):
+			print 'Error! a chunk size of %d changes the phase distribution.' % chunk_size
+			error_counter += 1
+
+	# 10 ** 400 overflows a float, the largest phase should still hold all of the chemical.
+	extreme = SWChemicalSpaceMap.phase_distribution([400.0], [0.0], volumes, coefficients)
+	if not np.all(np.isfinite(extreme)) or not np.isclose(extreme[0, 0, 0], 100.0):
+		print 'Error! extreme partition coefficients give %s.' % extreme.ravel()
+		error_counter += 1
+	try:
+		SWChemicalSpaceMap.phase_distribution(x, y, volumes[:2], coefficients)
+		print 'Error! fewer volumes than partition coefficients did not raise.'
+		error_counter += 1
+	except Exception:
+		pass
+	chemical_space_map = SWChemicalSpaceMap.SWChemicalSpaceMap.from_partitioning(x, y, volumes, coefficients, phase_names, draw = False)
+	if not np.array_equal(chemical_space_map.phi, phi):
+		print 'Error! from_partitioning maps another phase distribution.'
+		error_counter += 1
+
+	if error_counter:
+		print 'There was atleast 1 error detected with the phase distribution.'
+	else:
+		print 'Good! the phase distribution follows the partitioning formula!'
+
+if testing_render_maps:
+	# The maps should render in a process pool on the Agg backend, the same as one after another.
+	error_counter = 0
+	from matplotlib.image import imread
+	if matplotlib_imported:
+		print 'Error! importing SWChemicalSpaceMap loaded matplotlib.'
+		error_counter += 1
+	directory = tempfile.mkdtemp(prefix='swtester')
+	try:
+		jobs = [(x, y, SWChemicalSpaceMap.phase_distribution(x, y, (1.0, 0.001 * 10 ** k, 0.00001), coefficients), phase_names) for k in range(3)]
+		serial = SWChemicalSpaceMap.render_maps(jobs, [os.path.join(directory, 'serial%d.png' % k) for k in range(3)], processes = 1)
+		parallel = SWChemicalSpaceMap.render_maps(jobs, [os.path.join(directory, 'parallel%d.png' % k) for k in range(3)], processes = 2)
+		styled = SWChemicalSpaceMap.render_maps(jobs[:1], [os.path.join(directory, 'styled.png')], alpha = 0.5, plot_lines = True)
+		for a, b in zip(serial, parallel):
+			if not os.path.exists(b) or not np.array_equal(imread(a), imread(b)):
+				print 'Error! %s does not match the map rendered without a pool.' % os.path.basename(b)
+				error_counter += 1
+		if np.array_equal(imread(serial[0]), imread(serial[1])):
+			print 'Error! different phase distributions rendered the same map.'
+			error_counter += 1
+		if np.array_equal(imread(serial[0]), imread(styled[0])):
+			print 'Error! the properties were not applied to the map.'
+			error_counter += 1
+		if imread(serial[0]).shape[:2] != (600, 800):
+			print 'Error! the map has %s pixels instead of figsize times dpi.' % (imread(serial[0]).shape[:2],)
+			error_counter += 1
+		try:
+			SWChemicalSpaceMap.render_maps(jobs, serial[:2])
+			print 'Error! fewer filenames than maps did not raise.'
+			error_counter += 1
+		except Exception:
+			pass
+	finally:
+		shutil.rmtree(directory)
+
+	if error_counter:
+		print 'There was atleast 1 error detected with render_maps.'
+	else:
+		print 'Good! the maps render the same in a process pool!'
+
+if testing_adaptive:
+	# Restyling should redraw from path_cache, only a new phi should contour again.
+	error_counter = 0
+	from matplotlib.figure import Figure
+	from matplotlib.backends.backend_agg import FigureCanvasAgg
+	phi = SWChemicalSpaceMap.phase_distribution(x, y, volumes, coefficients)
+	chemical_space_map = SWChemicalSpaceMap.SWChemicalSpaceMap(x, y, phi, phase_names, draw = False)
+	chemical_space_map.adaptive = True
+	chemical_space_map.tile_size = 8
+	compute_contour_paths = chemical_space_map.compute_contour_paths
+	recomputed = []
+	def counting_compute_contour_paths(phase, levels, filled):
+		recomputed.append(len(levels))
+		return compute_contour_paths(phase, levels, filled)
+	chemical_space_map.compute_contour_paths = counting_compute_contour_paths
+
+	def plot():
+		del recomputed[:]
+		figure = Figure()
+		FigureCanvasAgg(figure)
+		ax = figure.add_subplot(111)
+		chemical_space_map.plot(ax)
+		return ax
+
+	if not len(plot().collections) or len(recomputed) != len(phase_names):
+		print 'Error! the first plot contoured %d phases instead of %d.' % (len(recomputed), len(phase_names))
+		error_counter += 1
+	for name, value in [('alpha', 0.5), ('colors', [('red', 'blue')] * 3), ('alpha', 1.0)]:
+		setattr(chemical_space_map, name, value)
+		plot()
+		if recomputed:
+			print 'Error! changing %s contoured %d phases again.' % (name, len(recomputed))
+			error_counter += 1
+	chemical_space_map.plot_lines = True
+	plot()
+	if len(recomputed) != len(phase_names):
+		print 'Error! the lines of %d phases were contoured instead of %d.' % (len(recomputed), len(phase_names))
+		error_counter += 1
+	plot()
+	if recomputed:
+		print 'Error! plotting the lines again contoured %d phases again.' % len(recomputed)
+		error_counter += 1
+	chemical_space_map.phi = SWChemicalSpaceMap.phase_distribution(x, y, (1.0, 0.01, 0.00001), coefficients)
+	plot()
+	if len(recomputed) != 2 * len(phase_names):
+		print 'Error! a new phi contoured %d times instead of %d.' % (len(recomputed), 2 * len(phase_names))
+		error_counter += 1
+	chemical_space_map.phi = list(chemical_space_map.phi)
+	plot()
+	chemical_space_map.phi[1] = phi[1]
+	plot()
+	if len(recomputed) != 2:
+		print 'Error! replacing one phase of a list contoured %d times instead of 2.' % len(recomputed)
+		error_counter += 1
+	chemical_space_map.path_cache.clear()
+	plot()
+	if len(recomputed) != 2 * len(phase_names):
+		print 'Error! clearing path_cache contoured %d times instead of %d.' % (len(recomputed), 2 * len(phase_names))
+		error_counter += 1
+
+	if error_counter:
+		print 'There was atleast 1 error detected with the adaptive contouring.'
+	else:
+		print 'Good! the contour paths are only computed for a new phi!'
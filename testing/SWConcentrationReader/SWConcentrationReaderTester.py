@@ -6,6 +6,15 @@ import SWConcentrationReader
 
 main_test = False;
 testing_features = True;
+testing_array_storage = True;
+testing_cache = True;
+testing_uneven_timestep = True;
+testing_CBAT_cube = True;
+testing_resampling = True;
+testing_refresh = True;
+testing_partial_row = True;
+testing_run_start = True;
+testing_ensemble = True;
 
 # Concentration dict for various years. I have looked in seqn 21005.csv for the concentrations for person born in 1985
 # and written them in here. They should agree with what the SWHumanConcentrationReader pulls out of the file.
@@ -74,3 +83,354 @@ if testing_features:
 	#print seqn_21005._SWHumanConcentrationReader__get_ages_for_CBAT(2004)
 	x = seqn_21005.extract_CBAT_for_year(2004)
 	print x
+
+if testing_array_storage:
+	# The array backed and lazy readers should give back exactly the same numbers as the default reader.
+	for storage in [SWConcentrationReader.SWHumanConcentrationReader.ARRAY_STORAGE, SWConcentrationReader.SWHumanConcentrationReader.LAZY_STORAGE]:
+		seqn_21005_array = SWConcentrationReader.SWHumanConcentrationReader(seqn21005_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+		error_counter = 0
+
+		for sampling_year, concentration in seqb21005_concentration_dict.iteritems():
+			predicted = seqn_21005_array.concentration_for_individual_at_sampling(seqn21005_birth_year, sampling_year)
+			if predicted != concentration:
+				print 'Error! %f is not equal to %f!' % (predicted, concentration)
+				error_counter += 1
+
+		sampling_years = list(seqb21005_concentration_dict.keys())
+		batch = seqn_21005_array.concentrations_for_individuals_at_sampling([seqn21005_birth_year] * len(sampling_years), sampling_years)
+		if list(batch) != [seqb21005_concentration_dict[year] for year in sampling_years]:
+			print 'Error! batch concentrations %s do not match.' % list(batch)
+			error_counter += 1
+
+		list_ages, list_CBAT_values = seqn_21005.extract_CBAT_for_year(2004)
+		ages, CBAT_values = seqn_21005_array.extract_CBAT_for_year(2004)
+		if list(ages) != list_ages or list(CBAT_values) != [float(c) for c in list_CBAT_values]:
+			print 'Error! %s CBAT does not match the list CBAT.' % storage
+			error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the %s storage.' % storage
+		else:
+			print 'Good! the %s storage agrees with the list storage!' % storage
+
+if testing_cache:
+	# A reader built from a fresh sidecar cache (cold) and one memory-mapping it (warm) should agree with the list reader.
+	import os
+	cache_filename = seqn21005_filename + SWConcentrationReader.SWHumanConcentrationReader.CACHE_EXTENSION
+	if os.path.exists(cache_filename):
+		os.remove(cache_filename)
+	error_counter = 0
+	try:
+		for state in ['cold', 'warm']:
+			seqn_21005_cached = SWConcentrationReader.SWHumanConcentrationReader(seqn21005_filename, age_at_model_start = seqn21005_age_at_model_start, cache = True)
+			for sampling_year, concentration in seqb21005_concentration_dict.iteritems():
+				predicted = seqn_21005_cached.concentration_for_individual_at_sampling(seqn21005_birth_year, sampling_year)
+				if predicted != concentration:
+					print 'Error! %f is not equal to %f with a %s cache!' % (predicted, concentration, state)
+					error_counter += 1
+			if [float(row[0]) for row in seqn_21005.data[seqn_21005.data_start_index:]] != list(seqn_21005_cached.data[:, 0]):
+				print 'Error! the times with a %s cache do not match.' % state
+				error_counter += 1
+			if state == 'warm' and not getattr(seqn_21005_cached.data, 'filename', None):
+				print 'Error! the warm cache was not memory-mapped.'
+				error_counter += 1
+		for storage in [SWConcentrationReader.SWHumanConcentrationReader.LIST_STORAGE, SWConcentrationReader.SWHumanConcentrationReader.LAZY_STORAGE]:
+			try:
+				SWConcentrationReader.SWHumanConcentrationReader(seqn21005_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage, cache = True)
+				print 'Error! cache = True with %s storage did not raise.' % storage
+				error_counter += 1
+			except Exception:
+				pass
+	finally:
+		if os.path.exists(cache_filename):
+			os.remove(cache_filename)
+
+	if error_counter:
+		print 'There was atleast 1 error detected with the cache.'
+	else:
+		print 'Good! the cold and warm cache agree with the list storage!'
+
+if testing_uneven_timestep:
+	# With a time step that does not divide a year (100 h) the batch lookup should still pick the rows the single lookup picks.
+	import os, shutil, sys, tempfile
+	sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+	import SWSyntheticData
+	directory = tempfile.mkdtemp(prefix='swtester')
+	error_counter = 0
+	try:
+		uneven_filename = SWSyntheticData.write_concentration_file(os.path.join(directory, 'CMAN.txt'), timestep = 100)
+		for storage in SWConcentrationReader.SWHumanConcentrationReader.STORAGE_TYPES:
+			uneven = SWConcentrationReader.SWHumanConcentrationReader(uneven_filename, storage = storage)
+			pairs = []
+			expected = []
+			for birth_year in sorted(uneven.column_dict):
+				for sampling_year in range(uneven.startyear, uneven.endyear + 1):
+					try: expected.append(uneven.concentration_for_individual_at_sampling(birth_year, sampling_year))
+					except (SWConcentrationReader.SWInvalidYearException, KeyError): continue
+					pairs.append((birth_year, sampling_year))
+			batch = uneven.concentrations_for_individuals_at_sampling([b for b, y in pairs], [y for b, y in pairs])
+			wrong = sum(1 for predicted, value in zip(batch, expected) if predicted != float(value))
+			if wrong:
+				print 'Error! %d of %d batch concentrations do not match with a 100 h time step (%s).' % (wrong, len(pairs), storage)
+				error_counter += 1
+	finally:
+		shutil.rmtree(directory)
+
+	if error_counter:
+		print 'There was atleast 1 error detected with a 100 h time step.'
+	else:
+		print 'Good! the batch lookup agrees with the single lookup for a 100 h time step!'
+
+if testing_CBAT_cube:
+	# Every row of the CBAT cube should be the CBAT of the list reader for that year, for every storage.
+	error_counter = 0
+	for storage in SWConcentrationReader.SWHumanConcentrationReader.STORAGE_TYPES:
+		seqn_21005_cube = SWConcentrationReader.SWHumanConcentrationReader(seqn21005_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+		years, ages, CBAT_values = seqn_21005_cube.extract_CBAT_cube()
+		if list(years) != range(seqn_21005.startyear + 1, seqn_21005.endyear + 1):
+			print 'Error! the %s CBAT cube years %s are not every year of the simulation.' % (storage, list(years))
+			error_counter += 1
+		for i, year in enumerate(years):
+			list_ages, list_CBAT_values = seqn_21005.extract_CBAT_for_year(year)
+			if list(ages[i]) != list_ages or list(CBAT_values[i]) != [float(c) for c in list_CBAT_values]:
+				print 'Error! the %s CBAT cube does not match the list CBAT for %d.' % (storage, year)
+				error_counter += 1
+
+		sliced_years, sliced_ages, sliced_CBAT_values = seqn_21005_cube.extract_CBAT_cube(start_year = 1990, end_year = 2000)
+		if list(sliced_years) != range(1990, 2001) or sliced_CBAT_values.tolist() != CBAT_values[list(years).index(1990):list(years).index(2000) + 1].tolist():
+			print 'Error! the %s CBAT cube sliced to 1990-2000 does not match the whole cube.' % storage
+			error_counter += 1
+
+		try:
+			seqn_21005_cube.extract_CBAT_cube(step = seqn_21005_cube.timestep + 1)
+			print 'Error! a CBAT step that is not a multiple of the time step did not raise.'
+			error_counter += 1
+		except Exception:
+			pass
+
+	if error_counter:
+		print 'There was atleast 1 error detected with the CBAT cube.'
+	else:
+		print 'Good! the CBAT cube agrees with the list CBAT for every year!'
+
+if testing_resampling:
+	# Resampled at the output times themselves, step and linear interpolation should give back the rows of the file.
+	import numpy as np
+	error_counter = 0
+	output_hours = [float(row[0]) for row in seqn_21005.data[seqn_21005.data_start_index:]]
+	output_years = [seqn_21005.startyear + hour / SWConcentrationReader.s.HOURS_IN_YEAR for hour in output_hours]
+	output_rows = [[float(c) for c in row[1:SWConcentrationReader.s.NUMBER_OF_HUMANS + 1]] for row in seqn_21005.data[seqn_21005.data_start_index:]]
+	for storage in SWConcentrationReader.SWHumanConcentrationReader.STORAGE_TYPES:
+		seqn_21005_resampled = SWConcentrationReader.SWHumanConcentrationReader(seqn21005_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+		for kind in SWConcentrationReader.SWHumanConcentrationReader.INTERPOLATION_TYPES:
+			resampled = seqn_21005_resampled.resample_concentrations(output_years, kind = kind)
+			wrong = np.count_nonzero(np.any(np.abs(resampled - output_rows) > 1e-9 * np.abs(output_rows), axis = 1) | np.any(np.isnan(resampled), axis = 1))
+			if wrong:
+				print 'Error! %d of %d output times resampled with %s interpolation do not match the file (%s).' % (wrong, len(output_years), kind, storage)
+				error_counter += 1
+
+		profile = seqn_21005.concentration_profile_for_individual_born_in_year(seqn21005_birth_year)
+		profile_years = [seqn21005_birth_year + i * seqn_21005.timestep / float(SWConcentrationReader.s.HOURS_IN_YEAR) for i in range(len(profile))]
+		resampled = seqn_21005_resampled.resample_profile_for_individual_born_in_year(seqn21005_birth_year, profile_years, kind = SWConcentrationReader.SWHumanConcentrationReader.STEP_INTERPOLATION)
+		if list(resampled) != [float(c) for c in profile]:
+			print 'Error! the profile resampled at its own output times does not match the profile (%s).' % storage
+			error_counter += 1
+
+	if error_counter:
+		print 'There was atleast 1 error detected when resampling.'
+	else:
+		print 'Good! resampling at the output times gives back the rows of the file!'
+
+if testing_refresh:
+	# A reader refreshed while the file grows in pieces cut mid line should end up like a reader of the whole file,
+	# and a file rewritten shorter (a restarted run) should be read again from the start.
+	import os, shutil, tempfile
+	with open(seqn21005_filename, 'rb') as f:
+		contents = f.read()
+	cuts = [len(contents) // 3 + 7, len(contents) // 2 + 3, 2 * len(contents) // 3 + 11, len(contents) - 5, len(contents)]
+	restarted = contents[:contents.index(b'\n', len(contents) // 4) + 1]
+	directory = tempfile.mkdtemp(prefix='swtester')
+	growing_filename = os.path.join(directory, seqn21005_filename)
+	error_counter = 0
+	try:
+		for storage in SWConcentrationReader.SWHumanConcentrationReader.STORAGE_TYPES:
+			with open(growing_filename, 'wb') as f:
+				f.write(contents[:len(contents) // 4 + 5])
+			growing = SWConcentrationReader.SWHumanConcentrationReader(growing_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+			new_rows = 0
+			for cut in cuts:
+				with open(growing_filename, 'ab') as f:
+					f.write(contents[os.path.getsize(growing_filename):cut])
+				new_rows += growing.refresh()
+			whole = SWConcentrationReader.SWHumanConcentrationReader(growing_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+			if growing.endyear != whole.endyear or growing.extract_CBAT_cube()[2].tolist() != whole.extract_CBAT_cube()[2].tolist():
+				print 'Error! refreshing after partial appends does not give the whole file (%s).' % storage
+				error_counter += 1
+			for sampling_year, concentration in seqb21005_concentration_dict.iteritems():
+				if growing.concentration_for_individual_at_sampling(seqn21005_birth_year, sampling_year) != concentration:
+					print 'Error! the refreshed %s reader has the wrong concentration for %d.' % (storage, sampling_year)
+					error_counter += 1
+
+			with open(growing_filename, 'wb') as f:
+				f.write(restarted)
+			points = []
+			refreshed_rows = growing.refresh(lambda *cbat: points.append(cbat))
+			shorter = SWConcentrationReader.SWHumanConcentrationReader(growing_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+			if growing.endyear != shorter.endyear or growing.follow_offset != len(restarted) or refreshed_rows != len(shorter.data) - shorter.data_start_index or len(points[0][0]) != refreshed_rows:
+				print 'Error! refreshing a rewritten, shorter file does not read it again (%s).' % storage
+				error_counter += 1
+	finally:
+		shutil.rmtree(directory)
+
+	if error_counter:
+		print 'There was atleast 1 error detected when refreshing.'
+	else:
+		print 'Good! refreshing follows partial appends and rewritten files!'
+
+if testing_partial_row:
+	# A file cut inside the hour field or in the middle of a row should be read up to its last whole row by every storage,
+	# and a refresh after the rest of the row arrives should read it.
+	import os, shutil, tempfile
+	with open(seqn21005_filename, 'rb') as f:
+		contents = f.read()
+	cuts = [('the hour field', contents.index(b'\n87600,') + 3), ('a row', contents.index(b'\n262800,') + 20)]
+	directory = tempfile.mkdtemp(prefix='swtester')
+	cut_filename = os.path.join(directory, seqn21005_filename)
+	error_counter = 0
+	try:
+		for name, cut in cuts:
+			with open(cut_filename, 'wb') as f:
+				f.write(contents[:contents.rindex(b'\n', 0, cut) + 1])
+			complete = SWConcentrationReader.SWHumanConcentrationReader(cut_filename, age_at_model_start = seqn21005_age_at_model_start)
+			with open(cut_filename, 'wb') as f:
+				f.write(contents[:cut])
+			for storage in SWConcentrationReader.SWHumanConcentrationReader.STORAGE_TYPES:
+				partial = SWConcentrationReader.SWHumanConcentrationReader(cut_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+				if partial.endyear != complete.endyear or len(partial.data) - partial.data_start_index != len(complete.data) - complete.data_start_index or len(partial.time_step_dict) != len(complete.time_step_dict):
+					print 'Error! a file cut in %s is read to %d instead of %d (%s).' % (name, partial.endyear, complete.endyear, storage)
+					error_counter += 1
+					continue
+				try:
+					profile = [float(c) for c in partial.concentration_profile_for_individual_born_in_year(1925)]
+				except Exception as e:
+					print 'Error! a file cut in %s raised %s for a profile (%s).' % (name, e, storage)
+					error_counter += 1
+					continue
+				if profile != [float(c) for c in complete.concentration_profile_for_individual_born_in_year(1925)]:
+					print 'Error! a file cut in %s gives another profile (%s).' % (name, storage)
+					error_counter += 1
+				with open(cut_filename, 'ab') as f:
+					f.write(contents[cut:contents.index(b'\n', cut) + 1])
+				refreshed_rows = partial.refresh()
+				whole = SWConcentrationReader.SWHumanConcentrationReader(cut_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+				if refreshed_rows != 1 or partial.endyear != whole.endyear or len(partial.data) != len(whole.data):
+					print 'Error! the row cut in %s was not read once it was complete (%s).' % (name, storage)
+					error_counter += 1
+				with open(cut_filename, 'wb') as f:
+					f.write(contents[:cut])
+	finally:
+		shutil.rmtree(directory)
+
+	if error_counter:
+		print 'There was atleast 1 error detected with partial rows.'
+	else:
+		print 'Good! every storage leaves out a row that is still being written!'
+
+if testing_run_start:
+	# A run that has just started (no data rows, or one) should open, refuse queries that need the time step
+	# and catch up with refresh. A file without its Time header should raise a clear error.
+	import os, shutil, tempfile
+	with open(seqn21005_filename, 'rb') as f:
+		contents = f.read()
+	header = contents.index(b'"Time"')
+	first_row = contents.index(b'\n', header) + 1
+	second_row = contents.index(b'\n', first_row) + 1
+	starts = [('a partial header', header + 20, 0), ('no data rows', first_row, 0), ('one data row', second_row, 1), ('one and a half data rows', second_row + 30, 1)] # name, bytes, data rows
+	directory = tempfile.mkdtemp(prefix='swtester')
+	start_filename = os.path.join(directory, seqn21005_filename)
+	error_counter = 0
+	try:
+		for storage in SWConcentrationReader.SWHumanConcentrationReader.STORAGE_TYPES:
+			for name, start, rows in starts:
+				with open(start_filename, 'wb') as f:
+					f.write(contents[:start])
+				try:
+					started = SWConcentrationReader.SWHumanConcentrationReader(start_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+				except Exception as e:
+					print 'Error! a file with %s raised %s (%s).' % (name, e, storage)
+					error_counter += 1
+					continue
+				if started.timestep is not None or started.endyear != started.startyear:
+					print 'Error! a file with %s has a time step of %s and ends in %d (%s).' % (name, started.timestep, started.endyear, storage)
+					error_counter += 1
+				try:
+					started.concentration_profile_for_individual_born_in_year(seqn21005_birth_year - 60)
+					print 'Error! a profile of a file with %s did not raise (%s).' % (name, storage)
+					error_counter += 1
+				except Exception as e:
+					if 'time step' not in str(e):
+						print 'Error! a profile of a file with %s raised %s (%s).' % (name, e, storage)
+						error_counter += 1
+				with open(start_filename, 'ab') as f:
+					f.write(contents[start:])
+				new_rows = started.refresh()
+				whole = SWConcentrationReader.SWHumanConcentrationReader(start_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+				if started.timestep != whole.timestep or started.endyear != whole.endyear or new_rows != len(whole.data) - whole.data_start_index - rows:
+					print 'Error! refreshing a file with %s does not give the whole file (%s).' % (name, storage)
+					error_counter += 1
+				for sampling_year, concentration in seqb21005_concentration_dict.iteritems():
+					if started.concentration_for_individual_at_sampling(seqn21005_birth_year, sampling_year) != concentration:
+						print 'Error! the refreshed %s reader of a file with %s has the wrong concentration for %d.' % (storage, name, sampling_year)
+						error_counter += 1
+
+			with open(start_filename, 'wb') as f:
+				f.write(contents[:header])
+			try:
+				SWConcentrationReader.SWHumanConcentrationReader(start_filename, age_at_model_start = seqn21005_age_at_model_start, storage = storage)
+				print 'Error! a file without its Time header did not raise (%s).' % storage
+				error_counter += 1
+			except Exception as e:
+				if 'header' not in str(e):
+					print 'Error! a file without its Time header raised %s (%s).' % (e, storage)
+					error_counter += 1
+	finally:
+		shutil.rmtree(directory)
+
+	if error_counter:
+		print 'There was atleast 1 error detected with a run that has just started.'
+	else:
+		print 'Good! a run that has just started is followed from its first row!'
+
+if testing_ensemble:
+	# An ensemble of copies of seqn 21005.csv loaded in a pool should answer like the single reader, for every storage and with the cache.
+	import os, shutil, tempfile
+	import numpy as np
+	directory = tempfile.mkdtemp(prefix='swtester')
+	error_counter = 0
+	try:
+		for i in range(3):
+			shutil.copy(seqn21005_filename, os.path.join(directory, 'seqn %d.csv' % i))
+		parameters = dict(('seqn %d.csv' % i, {'age_at_model_start' : seqn21005_age_at_model_start}) for i in range(3))
+		for storage, cache in [(SWConcentrationReader.SWHumanConcentrationReader.LIST_STORAGE, False), (SWConcentrationReader.SWHumanConcentrationReader.ARRAY_STORAGE, False),
+				(SWConcentrationReader.SWHumanConcentrationReader.LAZY_STORAGE, False), (SWConcentrationReader.SWHumanConcentrationReader.ARRAY_STORAGE, True)]:
+			ensemble = SWConcentrationReader.SWHumanConcentrationEnsemble(directory, parameters, processes = 2, storage = storage, cache = cache)
+			if len(ensemble) != 3 or any(reader.storage != storage for reader in ensemble.readers.values()):
+				print 'Error! the ensemble did not load 3 %s readers.' % storage
+				error_counter += 1
+			for sampling_year, concentration in seqb21005_concentration_dict.iteritems():
+				if ensemble.concentration_for_individual_at_sampling(seqn21005_birth_year, sampling_year).values() != [concentration] * 3:
+					print 'Error! the %s ensemble (cache %s) has the wrong concentrations for %d.' % (storage, cache, sampling_year)
+					error_counter += 1
+			if not all(np.isnan(ensemble.concentration_for_individual_at_sampling(seqn21005_birth_year, seqn_21005.endyear + 1).values())):
+				print 'Error! the %s ensemble does not give NaN after the simulation.' % storage
+				error_counter += 1
+			if cache and not all(getattr(reader.data, 'filename', None) for reader in ensemble.readers.values()): # a memmap sent through a pipe loses its file
+				print 'Error! the cached ensemble readers are not memory-mapped from their sidecars.'
+				error_counter += 1
+	finally:
+		shutil.rmtree(directory)
+
+	if error_counter:
+		print 'There was atleast 1 error detected with the ensemble.'
+	else:
+		print 'Good! the ensemble agrees with the single reader for every storage and with the cache!'
@@ -0,0 +1,162 @@
+# Testing the SWModelComparison
+
+# This is designed to test that every NHANES respondent is compared with the CBAT of the reader of their gender.
+# The model files and cycles are synthetic (see ../benchmarks/SWSyntheticData.py) and written to a temporary folder.
+
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import SWSyntheticData
+import SWNhanesReader
+import SWSettings as s
+from SWConcentrationReader import SWHumanConcentrationReader
+from SWModelComparison import SWModelComparison
+
+testing_interpolation = True;
+testing_clamped = True;
+testing_uneven_timestep = True;
+testing_missing_reader = True;
+testing_panel = True;
+
+cycles = ('1999-2000', '2001-2002', '2003-2004')
+pcb = 'PCB-153'
+
+directory = tempfile.mkdtemp(prefix='swtester')
+data_path = s.NHANES_DATA_PATH
+s.NHANES_DATA_PATH = directory
+
+def expected_CBAT(reader, year, age):
+	"""interpolates the reader's own CBAT for the year, clamped at both ends"""
+	ages, values = reader.extract_CBAT_for_year(year)
+	return np.interp(age, ages, np.asarray(values, dtype = np.float64))
+
+try:
+	for seed, nhanes_year in enumerate(cycles):
+		SWSyntheticData.write_nhanes_cycle(directory, nhanes_year, respondents = 400, food_records = 1, seed = seed)
+	man = SWHumanConcentrationReader(SWSyntheticData.write_concentration_file(os.path.join(directory, 'CMAN.txt')))
+	woman = SWHumanConcentrationReader(SWSyntheticData.write_concentration_file(os.path.join(directory, 'CWOMAN.txt'), female = True, seed = 1))
+	nhanes = SWNhanesReader.SWNhanesReader(columnar = True)
+	comparison = SWModelComparison(nhanes, {pcb : (man, woman)})
+	table = comparison.table
+
+	if testing_interpolation:
+		# Each prediction should be the CBAT of the sampling year read at the respondent's age.
+		error_counter = 0
+		ages, genders, concentrations = nhanes.get_arrays_for_codes([nhanes.get_nhanes_code_for_pcb(pcb)])
+		if len(table['seqn']) != np.sum(~np.isnan(concentrations[0])):
+			print 'Error! the table has %d rows for %d measured respondents.' % (len(table['seqn']), np.sum(~np.isnan(concentrations[0])))
+			error_counter += 1
+		for row in range(len(table['seqn'])):
+			reader = man if table['gender'][row] == SWModelComparison.MALE else woman
+			expected = expected_CBAT(reader, 2003, table['age'][row])
+			if not np.isclose(table['predicted'][row], expected):
+				print 'Error! respondent %d is predicted %f instead of %f.' % (table['seqn'][row], table['predicted'][row], expected)
+				error_counter += 1
+		if not np.allclose(table['residual'], table['observed'] - table['predicted']):
+			print 'Error! the residuals are not observed minus predicted.'
+			error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the interpolation.'
+		else:
+			print 'Good! the predictions are the CBATs at the respondents ages!'
+
+	if testing_clamped:
+		# Respondents older than the oldest or younger than the youngest simulated person keep a prediction and are marked.
+		error_counter = 0
+		ages, values = man.extract_CBAT_for_year(2003)
+		outside = (table['age'] < ages[0]) | (table['age'] > ages[-1])
+		if not outside.any() or not (table['age'] > ages[-1]).any():
+			print 'Error! the synthetic cycle has no respondents older than the oldest simulated person.'
+			error_counter += 1
+		if np.isnan(table['predicted']).any():
+			print 'Error! %d respondents got no prediction.' % np.isnan(table['predicted']).sum()
+			error_counter += 1
+		if not np.array_equal(table['clamped'], outside):
+			print 'Error! the clamped column does not mark the ages outside of the CBAT.'
+			error_counter += 1
+		oldest = (table['age'] > ages[-1]) & (table['gender'] == SWModelComparison.MALE)
+		if not np.allclose(table['predicted'][oldest], float(values[-1])):
+			print 'Error! the oldest respondents do not get the value of the oldest simulated person.'
+			error_counter += 1
+		metrics = comparison.metrics[nhanes.get_nhanes_code_for_pcb(pcb)]
+		if metrics['count'] != len(table['seqn']) or metrics['clamped'] != outside.sum() or comparison.metrics['all']['count'] != len(table['seqn']):
+			print 'Error! the metrics leave out respondents (%d of %d counted).' % (metrics['count'], len(table['seqn']))
+			error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the clamped ages.'
+		else:
+			print 'Good! ages outside of the CBAT are clamped and marked!'
+
+	if testing_uneven_timestep:
+		# A time step that does not divide a year should be read at the same rows as the sampling lookups.
+		error_counter = 0
+		for timestep in [720, 100]:
+			uneven = SWHumanConcentrationReader(SWSyntheticData.write_concentration_file(os.path.join(directory, 'CMAN%d.txt' % timestep), timestep = timestep))
+			try:
+				other = SWModelComparison(nhanes, {pcb : (uneven, None)}).table
+			except Exception as e:
+				print 'Error! a time step of %d hours raised: %s' % (timestep, e)
+				error_counter += 1
+				continue
+			male = other['gender'] == SWModelComparison.MALE
+			if np.isnan(other['predicted'][male]).any():
+				print 'Error! a time step of %d hours left men without a prediction.' % timestep
+				error_counter += 1
+			for age in range(10, 80, 10):
+				rows = male & (other['age'] == 3 + age) # the simulated people are born in 1930, 1940, ...
+				expected = uneven.concentrations_for_individuals_at_sampling([2003 - 3 - age], [2003]).astype(np.float64)
+				if not np.allclose(other['predicted'][rows], expected):
+					print 'Error! a time step of %d hours predicts age %d wrong.' % (timestep, 3 + age)
+					error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the uneven time steps.'
+		else:
+			print 'Good! time steps that do not divide a year are compared!'
+
+	if testing_missing_reader:
+		# A gender without a reader gets no prediction and is left out of the metrics.
+		error_counter = 0
+		other = SWModelComparison(nhanes, {pcb : (man, None)})
+		female = other.table['gender'] == SWModelComparison.FEMALE
+		if not np.isnan(other.table['predicted'][female]).all() or (other.table['model_birth_year'][female] != -1).any():
+			print 'Error! women were predicted without a CWOMAN reader.'
+			error_counter += 1
+		if other.metrics['all']['count'] != np.sum(~female):
+			print 'Error! the metrics count %d respondents instead of %d.' % (other.metrics['all']['count'], np.sum(~female))
+			error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with a missing reader.'
+		else:
+			print 'Good! a gender without a reader is left out!'
+
+	if testing_panel:
+		# Every cycle of a panel should be read at its own sampling year.
+		error_counter = 0
+		panel = SWNhanesReader.SWNhanesPanel(cycles, variables = [pcb])
+		other = SWModelComparison(panel, {pcb : (man, woman)}, sampling_years = {'2001-2002' : 2002}).table
+		if sorted(set(other['sampling_year'])) != [1999, 2002, 2003]:
+			print 'Error! the panel is sampled in %s.' % sorted(set(other['sampling_year']))
+			error_counter += 1
+		for row in range(0, len(other['seqn']), 7):
+			reader = man if other['gender'][row] == SWModelComparison.MALE else woman
+			expected = expected_CBAT(reader, other['sampling_year'][row], other['age'][row])
+			if not np.isclose(other['predicted'][row], expected):
+				print 'Error! respondent %d of the panel is predicted %f instead of %f.' % (other['seqn'][row], other['predicted'][row], expected)
+				error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the panel.'
+		else:
+			print 'Good! every cycle of the panel is read at its sampling year!'
+finally:
+	s.NHANES_DATA_PATH = data_path
+	shutil.rmtree(directory)
@@ -0,0 +1,240 @@
+# Testing the SWNhanesReader
+
+# This is designed to test that the storages of the SWNhanesReader class give back the same numbers.
+# The cycles are synthetic (see ../benchmarks/SWSyntheticData.py) and written to a temporary folder.
+
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import SWSyntheticData
+import SWNhanesReader
+import SWSettings as s
+
+testing_storages = True;
+testing_summary = True;
+testing_selected_variables = True;
+testing_lazy_diet = True;
+testing_load_cycles = True;
+testing_panel = True;
+testing_bootstrap = True;
+testing_index = True;
+
+cycles = ('1999-2000', '2001-2002', '2003-2004')
+pcbs = ['PCB-153', 'PCB-138', 'PCB-180']
+age_groups = [(11, 20), (21, 40), (41, 85)]
+
+directory = tempfile.mkdtemp(prefix='swtester')
+data_path = s.NHANES_DATA_PATH
+s.NHANES_DATA_PATH = directory
+
+def sorted_pairs(ages, concentrations):
+	return sorted(zip([float(a) for a in ages], [float(c) for c in concentrations]))
+
+try:
+	for seed, nhanes_year in enumerate(cycles):
+		SWSyntheticData.write_nhanes_cycle(directory, nhanes_year, respondents = 400, food_records = 3, seed = seed)
+
+	# The dict of dicts reader is the reference every other storage is compared to.
+	nhanes = SWNhanesReader.SWNhanesReader(diet = True)
+
+	if testing_storages:
+		# Every other storage of the same cycle should agree with the dict.
+		error_counter = 0
+		readers = [
+			('columnar', lambda: SWNhanesReader.SWNhanesReader(columnar = True)),
+			('cold cache', lambda: SWNhanesReader.SWNhanesReader(cache = True)),
+			('warm cache', lambda: SWNhanesReader.SWNhanesReader(cache = True)),
+			('parallel dict', lambda: SWNhanesReader.SWNhanesReader(processes = 2)),
+			('parallel columnar', lambda: SWNhanesReader.SWNhanesReader(columnar = True, processes = 2)),
+		]
+		for name, load in readers:
+			other = load()
+			if sorted(other.get_list_of_seqn()) != sorted(nhanes.get_list_of_seqn()):
+				print 'Error! the %s reader has other respondents.' % name
+				error_counter += 1
+			for pcb in pcbs:
+				if sorted(other.get_list_of_seqn_for_pcb(pcb)) != sorted(nhanes.get_list_of_seqn_for_pcb(pcb)):
+					print 'Error! the %s reader has other respondents for %s.' % (name, pcb)
+					error_counter += 1
+				for seqn in nhanes.get_list_of_seqn_for_pcb(pcb)[:20]:
+					if other.concentration_for_seqn_for_pcb(seqn, pcb) != nhanes.concentration_for_seqn_for_pcb(seqn, pcb):
+						print 'Error! the %s reader has another %s concentration for %d.' % (name, pcb, seqn)
+						error_counter += 1
+				for female in [False, True]:
+					if other.get_median_concentration_for_pcb_for_gender(pcb, female) != nhanes.get_median_concentration_for_pcb_for_gender(pcb, female):
+						print 'Error! the %s reader has other %s medians (female %s).' % (name, pcb, female)
+						error_counter += 1
+					if other.get_median_concentration_for_all_ages_for_pcb_for_gender(pcb, female) != nhanes.get_median_concentration_for_all_ages_for_pcb_for_gender(pcb, female):
+						print 'Error! the %s reader has another %s median for all ages (female %s).' % (name, pcb, female)
+						error_counter += 1
+					if sorted_pairs(*other.get_age_and_concentration_for_pcb_for_gender(pcb, female)) != sorted_pairs(*nhanes.get_age_and_concentration_for_pcb_for_gender(pcb, female)):
+						print 'Error! the %s reader has other %s ages and concentrations (female %s).' % (name, pcb, female)
+						error_counter += 1
+			if name == 'warm cache' and not getattr(other.data.column(s.AGE_CODE), 'filename', None):
+				print 'Error! the warm cache was not memory-mapped.'
+				error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the NHANES storages.'
+		else:
+			print 'Good! every storage agrees with the dict reader!'
+
+	if testing_summary:
+		# The one pass summary should give the counts, median ages and percentiles of the per group queries.
+		error_counter = 0
+		bin_edges = [age_group[0] for age_group in age_groups] + [age_groups[-1][1] + 1]
+		for reader in [nhanes, SWNhanesReader.SWNhanesReader(columnar = True)]:
+			summary = reader.get_summary_for_pcbs(pcbs, percentiles = (25, 50), bin_edges = bin_edges)
+			for i in range(len(summary['pcb'])):
+				ages, concentrations = nhanes.get_concentrations_for_pcb_for_age_group_for_gender(summary['pcb'][i], summary['min_age'][i], summary['max_age'][i], summary['female'][i])
+				if summary['count'][i] != len(concentrations) or not np.allclose(summary['percentiles'][i], np.percentile(concentrations, [25, 50])) or summary['median_age'][i] != np.median(ages):
+					print 'Error! the summary of %s (female %s, %d-%d) does not match.' % (summary['pcb'][i], summary['female'][i], summary['min_age'][i], summary['max_age'][i])
+					error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the summary.'
+		else:
+			print 'Good! the summary agrees with the per group queries!'
+
+	if testing_selected_variables:
+		# Reading only some variables should not change their values.
+		error_counter = 0
+		for columnar in [False, True]:
+			selected = SWNhanesReader.SWNhanesReader(columnar = columnar, variables = pcbs[:1]) # ages and genders are always read
+			if sorted(selected.get_list_of_seqn_for_pcb(pcbs[0])) != sorted(nhanes.get_list_of_seqn_for_pcb(pcbs[0])):
+				print 'Error! reading only %s (columnar %s) gives other respondents.' % (pcbs[0], columnar)
+				error_counter += 1
+			for female in [False, True]:
+				if selected.get_median_concentration_for_pcb_for_gender(pcbs[0], female) != nhanes.get_median_concentration_for_pcb_for_gender(pcbs[0], female):
+					print 'Error! reading only %s (columnar %s) gives other medians.' % (pcbs[0], columnar)
+					error_counter += 1
+			if selected.get_list_of_seqn_for_pcb(pcbs[1]):
+				print 'Error! reading only %s (columnar %s) still read %s.' % (pcbs[0], columnar, pcbs[1])
+				error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected reading selected variables.'
+		else:
+			print 'Good! reading selected variables agrees with reading everything!'
+
+	if testing_lazy_diet:
+		# Food records parsed on demand (or from the columnar table) should be the ones of the dict.
+		error_counter = 0
+		for name, other in [('lazy', SWNhanesReader.SWNhanesReader(diet = SWNhanesReader.SWNhanesReader.LAZY_DIET)), ('columnar', SWNhanesReader.SWNhanesReader(diet = True, columnar = True))]:
+			for seqn in sorted(nhanes.get_list_of_seqn())[::25]:
+				if other.food_records_for_seqn(seqn) != nhanes.food_records_for_seqn(seqn):
+					print 'Error! the %s food records for %d do not match.' % (name, seqn)
+					error_counter += 1
+			if sum(len(chunk) for chunk in other.iter_food_records(chunk_size = 100)) != sum(len(chunk) for chunk in nhanes.iter_food_records()):
+				print 'Error! iterating the %s food records gives another number of records.' % name
+				error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the food records.'
+		else:
+			print 'Good! the lazy and columnar food records agree with the dict!'
+
+	if testing_load_cycles:
+		# Cycles loaded concurrently should be the cycles loaded one by one.
+		error_counter = 0
+		for kwargs in [{'columnar' : True}, {'cache' : True}]:
+			loaded = SWNhanesReader.load_cycles(cycles, processes = 2, **kwargs)
+			for nhanes_year in cycles:
+				reader = SWNhanesReader.SWNhanesReader(nhanes_year, columnar = True)
+				for female in [False, True]:
+					if sorted_pairs(*loaded[nhanes_year].get_age_and_concentration_for_pcb_for_gender(pcbs[0], female)) != sorted_pairs(*reader.get_age_and_concentration_for_pcb_for_gender(pcbs[0], female)):
+						print 'Error! the %s cycle loaded concurrently (%s) does not match (female %s).' % (nhanes_year, kwargs, female)
+						error_counter += 1
+				if kwargs.get('cache') and not getattr(loaded[nhanes_year].data.column(s.AGE_CODE), 'filename', None):
+					print 'Error! the cached %s cycle came back from the pool as a copy.' % nhanes_year
+					error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected loading cycles concurrently.'
+		else:
+			print 'Good! the cycles loaded concurrently agree with the cycles loaded one by one!'
+
+	if testing_panel:
+		# Every cycle of the panel should be the reader of that cycle.
+		error_counter = 0
+		panel = SWNhanesReader.SWNhanesPanel(cycles, processes = 2)
+		total = 0
+		for nhanes_year in cycles:
+			reader = SWNhanesReader.SWNhanesReader(nhanes_year, columnar = True)
+			total += len(reader.data)
+			cycle = panel.for_cycles([nhanes_year])
+			for female in [False, True]:
+				if sorted_pairs(*cycle.get_age_and_concentration_for_pcb_for_gender(pcbs[0], female)) != sorted_pairs(*reader.get_age_and_concentration_for_pcb_for_gender(pcbs[0], female)):
+					print 'Error! the %s cycle of the panel does not match its reader (female %s).' % (nhanes_year, female)
+					error_counter += 1
+				cycle_names, ages, concentrations = panel.get_cycle_age_and_concentration_for_pcb_for_gender(pcbs[0], female)
+				in_cycle = cycle_names == nhanes_year
+				if sorted_pairs(ages[in_cycle], concentrations[in_cycle]) != sorted_pairs(*reader.get_age_and_concentration_for_pcb_for_gender(pcbs[0], female)):
+					print 'Error! the %s rows of the whole panel do not match its reader (female %s).' % (nhanes_year, female)
+					error_counter += 1
+		if len(panel.data) != total:
+			print 'Error! the panel has %d respondents instead of %d.' % (len(panel.data), total)
+			error_counter += 1
+		for method in [lambda: panel.food_records_for_seqn(panel.data.seqn[0]), lambda: next(panel.iter_food_records())]:
+			try:
+				method()
+				print 'Error! asking the panel for food records did not raise.'
+				error_counter += 1
+			except AttributeError:
+				print 'Error! asking the panel for food records failed without saying why.'
+				error_counter += 1
+			except Exception:
+				pass
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the panel.'
+		else:
+			print 'Good! every cycle of the panel agrees with its reader!'
+
+	if testing_bootstrap:
+		# The bootstrap interval should repeat with a seed whatever the chunk size, and hold the median.
+		error_counter = 0
+		for min_age, max_age in age_groups:
+			first = nhanes.get_median_concentration_ci_for_pcb_for_age_group_for_gender(pcbs[0], min_age, max_age, True, replicates = 200, seed = 1, chunk_size = 30)
+			second = nhanes.get_median_concentration_ci_for_pcb_for_age_group_for_gender(pcbs[0], min_age, max_age, True, replicates = 200, seed = 1)
+			if first != second or not first[2] <= first[1] <= first[3]:
+				print 'Error! the bootstrap interval %s for %d-%d is not repeatable or does not hold the median.' % (first, min_age, max_age)
+				error_counter += 1
+		summary = nhanes.get_summary_for_pcbs(pcbs[:1], replicates = 50, seed = 2)
+		if summary['median_ci'].shape != (len(summary['pcb']), 2):
+			print 'Error! the summary has %s confidence intervals for %d groups.' % (summary['median_ci'].shape, len(summary['pcb']))
+			error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the bootstrap.'
+		else:
+			print 'Good! the bootstrap intervals are repeatable and hold the medians!'
+
+	if testing_index:
+		# The bitmap and age order indexes should find the respondents a scan of the dict finds.
+		error_counter = 0
+		columnar = SWNhanesReader.SWNhanesReader(columnar = True)
+		for pcb in pcbs:
+			pcb_string = nhanes.get_nhanes_code_for_pcb(pcb)
+			for female in [False, True]:
+				for min_age, max_age in [(None, None)] + age_groups:
+					expected = sorted(seqn for seqn, row in nhanes.data.items() if pcb_string in row and row.get(s.GENDER_CODE) == nhanes.gender_number_if_female(female)
+						and (min_age is None or min_age <= row.get(s.AGE_CODE, -1) <= max_age))
+					for name, reader in [('dict', nhanes), ('columnar', columnar)]:
+						for repeat in range(2): # the second query comes from the indexes already built
+							if sorted(reader.seqn_for_pcb_for_gender(pcb_string, female, min_age, max_age)) != expected:
+								print 'Error! the %s index finds other %s respondents (female %s, ages %s-%s).' % (name, pcb, female, min_age, max_age)
+								error_counter += 1
+
+		if error_counter:
+			print 'There was atleast 1 error detected with the indexes.'
+		else:
+			print 'Good! the indexes agree with a scan of the respondents!'
+finally:
+	s.NHANES_DATA_PATH = data_path
+	shutil.rmtree(directory)
@@ -0,0 +1,131 @@
+# Testing the SWStats
+
+# This is designed to test that SWStats records the calls, rows and peak memory of every phase.
+# The peak memory is only measured on Linux, where the high-water mark of the process can be reset.
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import SWSyntheticData
+import SWStats
+from SWConcentrationReader import SWHumanConcentrationReader
+
+testing_totals = True;
+testing_peak_memory = True;
+testing_reader = True;
+
+MEGABYTE = 1024 # peak_memory is in kilobytes
+ALLOCATION = 200 # megabytes allocated by the big phases
+
+def allocate(megabytes):
+	a = np.ones(megabytes * 1024 * 1024 // 8) # ones touches every page
+	return a.sum()
+
+if testing_totals:
+	# Calls, rows, cells and failures should add up over calls, the callback should see every call.
+	error_counter = 0
+	calls = []
+	stats = SWStats.SWStats(calls.append)
+	for i in range(3):
+		with stats.measure('phase') as call:
+			call.rows = 10
+			call.cells = 80
+			call.failures = i
+	with stats.measure('other phase'):
+		pass
+	phase = stats['phase']
+	if (phase.calls, phase.rows, phase.cells, phase.failures) != (3, 30, 240, 3):
+		print 'Error! the totals are %s.' % phase
+		error_counter += 1
+	if [call.name for call in calls] != ['phase'] * 3 + ['other phase'] or [call.calls for call in calls] != [1] * 4:
+		print 'Error! the callback saw %s.' % calls
+		error_counter += 1
+	if [phase.name for phase in stats] != ['phase', 'other phase'] or 'other phase' not in stats:
+		print 'Error! the phases are not kept in the order they first ran.'
+		error_counter += 1
+	report = stats.report().splitlines()
+	if len(report) != 3 or 'peak memory' not in report[0]:
+		print 'Error! the report is:\n%s' % stats.report()
+		error_counter += 1
+	if pickle.loads(pickle.dumps(stats)).callback is not None:
+		print 'Error! the callback was pickled.'
+		error_counter += 1
+
+	if error_counter:
+		print 'There was atleast 1 error detected with the totals.'
+	else:
+		print 'Good! the totals add up!'
+
+if testing_peak_memory:
+	# Each phase should report its own peak, not the peak of the process or the growth between start and end.
+	error_counter = 0
+	stats = SWStats.SWStats()
+	allocate(ALLOCATION) # an earlier peak the phases below should not see
+	with stats.measure('small'):
+		pass
+	with stats.measure('outer'):
+		with stats.measure('big'):
+			allocate(ALLOCATION) # freed before the phase ends, so the resident size does not grow
+		with stats.measure('small after big'):
+			pass
+	small, big, outer, small_after = stats['small'], stats['big'], stats['outer'], stats['small after big']
+	if SWStats.high_water_mark() is None or not os.access('/proc/self/clear_refs', os.W_OK):
+		if any(phase.peak_memory is not None for phase in stats):
+			print 'Error! peak memory was reported without a way to measure it.'
+			error_counter += 1
+	else:
+		if None in (small.peak_memory, big.peak_memory, outer.peak_memory, small_after.peak_memory):
+			print 'Error! the peak memory was not measured on Linux.'
+			error_counter += 1
+		elif big.peak_memory - small.peak_memory < ALLOCATION * MEGABYTE * 0.9:
+			print 'Error! the big phase peaked at %d kB and the small one at %d kB.' % (big.peak_memory, small.peak_memory)
+			error_counter += 1
+		elif big.peak_memory - small_after.peak_memory < ALLOCATION * MEGABYTE * 0.9:
+			print 'Error! the phase after the big one peaked at %d kB, the high-water mark was not reset.' % small_after.peak_memory
+			error_counter += 1
+		elif outer.peak_memory < big.peak_memory:
+			print 'Error! the outer phase peaked at %d kB below the %d kB of the phase inside it.' % (outer.peak_memory, big.peak_memory)
+			error_counter += 1
+		with stats.measure('small'):
+			allocate(ALLOCATION)
+		if stats['small'].peak_memory < big.peak_memory * 0.9 or stats['small'].calls != 2:
+			print 'Error! the totals do not keep the largest peak of all calls.'
+			error_counter += 1
+
+	if error_counter:
+		print 'There was atleast 1 error detected with the peak memory.'
+	else:
+		print 'Good! every phase reports its own peak memory!'
+
+if testing_reader:
+	# A reader with stats should record its load phases and queries.
+	error_counter = 0
+	directory = tempfile.mkdtemp(prefix='swtester')
+	try:
+		filename = SWSyntheticData.write_concentration_file(os.path.join(directory, 'CMAN.txt'))
+		for storage in SWHumanConcentrationReader.STORAGE_TYPES:
+			stats = SWStats.SWStats()
+			reader = SWHumanConcentrationReader(filename, storage = storage, stats = stats)
+			profile = reader.concentration_profile_for_individual_born_in_year(1950)
+			reader.concentration_profile_for_individual_born_in_year(1950)
+			names = [phase.name for phase in stats]
+			if not any('create_time_step_dict' in name for name in names):
+				print 'Error! the %s reader did not record its load phases: %s' % (storage, names)
+				error_counter += 1
+			query = stats['SWHumanConcentrationReader.concentration_profile_for_individual_born_in_year']
+			if query.calls != 2 or query.rows != 2 * len(profile):
+				print 'Error! the %s reader recorded %s for its profiles.' % (storage, query)
+				error_counter += 1
+	finally:
+		shutil.rmtree(directory)
+
+	if error_counter:
+		print 'There was atleast 1 error detected with the reader stats.'
+	else:
+		print 'Good! the readers record their phases and queries!'
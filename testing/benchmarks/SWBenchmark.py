@@ -0,0 +1,95 @@
+# SWBenchmark.py
+# Times loading and querying of SWHumanConcentrationReader and SWNhanesReader
+# on synthetic files of several sizes, so regressions and scaling limits show up.
+#
+# Usage: python SWBenchmark.py [small|medium|large ...]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')) # the readers live in the repository root
+import SWSettings as s
+import SWConcentrationReader
+import SWNhanesReader
+import SWSyntheticData
+
+# name : (end year, time step in hours, NHANES respondents, food records per respondent)
+SIZES = {
+	'small'  : (2010, 120, 1000, 5),
+	'medium' : (2050, 24, 5000, 10),
+	'large'  : (2130, 4, 10000, 20),
+}
+DEFAULT_SIZES = ['small', 'medium']
+REPEAT = 3
+SINGLE_CALL_SAMPLE = 100 # one-call-each lookups are slow, only time a sample of them
+
+def time_it(function, repeat=REPEAT):
+	"""best wall time of a few runs"""
+	best = None
+	for i in range(repeat):
+		start = time.time()
+		function()
+		elapsed = time.time() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def report(size, name, seconds):
+	print '%-8s %-50s %10.4f s' % (size, name, seconds)
+
+def benchmark_concentration_reader(size, directory):
+	endyear, timestep, respondents, food_records = SIZES[size]
+	Reader = SWConcentrationReader.SWHumanConcentrationReader
+	filename = SWSyntheticData.write_concentration_file(os.path.join(directory, 'CMAN.txt'), endyear=endyear, timestep=timestep)
+
+	for storage in Reader.STORAGE_TYPES:
+		report(size, 'load (%s)' % storage, time_it(lambda: Reader(filename, storage=storage)))
+	cache_filename = filename + Reader.CACHE_EXTENSION
+	def load_cold_cache():
+		if os.path.exists(cache_filename):
+			os.remove(cache_filename)
+		Reader(filename, cache=True)
+	report(size, 'load (cache, cold)', time_it(load_cold_cache))
+	report(size, 'load (cache, warm)', time_it(lambda: Reader(filename, cache=True)))
+
+	for storage in Reader.STORAGE_TYPES:
+		reader = Reader(filename, storage=storage)
+		birth_years = [year for year in sorted(reader.column_dict) if year < reader.endyear]
+		years = range(reader.startyear + 1, reader.endyear + 1)
+		pairs = [(birth_year, year) for birth_year in birth_years for year in years if 0 < year - birth_year]
+
+		report(size, 'profiles for all birth years (%s)' % storage, time_it(lambda: [reader.concentration_profile_for_individual_born_in_year(year) for year in birth_years]))
+		report(size, 'CBAT for every year (%s)' % storage, time_it(lambda: [reader.extract_CBAT_for_year(year) for year in years]))
+		report(size, 'CBAT cube (%s)' % storage, time_it(lambda: (reader.CBAT_cubes.clear(), reader.extract_CBAT_cube())))
+		sample = pairs[::max(1, len(pairs) // SINGLE_CALL_SAMPLE)]
+		report(size, '%d sampling lookups, one call each (%s)' % (len(sample), storage), time_it(lambda: [reader.concentration_for_individual_at_sampling(b, y) for b, y in sample], repeat=1))
+		report(size, '%d sampling lookups, batch (%s)' % (len(pairs), storage), time_it(lambda: reader.concentrations_for_individuals_at_sampling([b for b, y in pairs], [y for b, y in pairs])))
+
+def benchmark_nhanes_reader(size, directory):
+	endyear, timestep, respondents, food_records = SIZES[size]
+	SWSyntheticData.write_nhanes_cycle(directory, respondents=respondents, food_records=food_records)
+	data_path = s.NHANES_DATA_PATH
+	s.NHANES_DATA_PATH = directory
+	try:
+		report(size, 'NHANES load, %d respondents' % respondents, time_it(lambda: SWNhanesReader.SWNhanesReader()))
+		report(size, 'NHANES load, columnar', time_it(lambda: SWNhanesReader.SWNhanesReader(columnar=True)))
+		report(size, 'NHANES load, columnar, files parsed in parallel', time_it(lambda: SWNhanesReader.SWNhanesReader(columnar=True, processes=None)))
+		report(size, 'NHANES load with diet, %d food records' % (respondents * food_records), time_it(lambda: SWNhanesReader.SWNhanesReader(diet=True), repeat=1))
+		reader = SWNhanesReader.SWNhanesReader()
+		report(size, 'NHANES medians by age group, 7 congeners x 2 genders', time_it(lambda: [reader.get_median_concentration_for_pcb_for_gender(pcb, female) for pcb in SWSyntheticData.PCB_CODES for female in (True, False)]))
+		report(size, 'NHANES summary table, 7 congeners x 2 genders, one pass', time_it(lambda: reader.get_summary_for_pcbs(SWSyntheticData.PCB_CODES, percentiles=(5, 50, 95))))
+		report(size, 'NHANES 1000 congener/gender/age range sub-queries', time_it(lambda: [reader.get_concentrations_for_pcb_for_age_group_for_gender('PCB-153', 11 + i % 70, 15 + i % 70, i % 2 == 0) for i in range(1000)]))
+	finally:
+		s.NHANES_DATA_PATH = data_path
+
+if __name__ == '__main__':
+	sizes = sys.argv[1:] or DEFAULT_SIZES
+	for size in sizes:
+		directory = tempfile.mkdtemp(prefix='swbenchmark')
+		try:
+			benchmark_concentration_reader(size, directory)
+			benchmark_nhanes_reader(size, directory)
+		finally:
+			shutil.rmtree(directory)
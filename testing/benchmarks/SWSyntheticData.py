@@ -0,0 +1,108 @@
+# SWSyntheticData.py
+# Writes synthetic ACC-HUMAN and NHANES files with the same layout as the real ones,
+# so the readers can be timed at any data size without the original data.
+
+import csv
+import os
+import numpy as np
+import SWSettings as s
+from SWNhanesReader import SWNhanesReader
+
+PCB_CODES = ['LBX028LA', 'LBX052LA', 'LBX101LA', 'LBX118LA', 'LBX138LA', s.PCB153_CODE, 'LBX180LA']
+
+def write_concentration_file(filename, startyear=s.DEFAULT_START_YEAR, endyear=2010, timestep=120, age_at_model_start=s.DEFAULT_AGE_AT_MODEL_START, female=False, preamble=True, chemical='PCB-153', seed=0):
+	"""Write a CMAN.txt/CWOMAN.txt style file in the lifetime of organism format.
+
+	Each of the eight columns holds a person born every 80 years, in the same
+	columns SWHumanConcentrationReader expects them, following a made up emission history.
+	"""
+	rng = np.random.RandomState(seed)
+	hours = np.arange(0, (endyear - startyear) * s.HOURS_IN_YEAR + 1, timestep)
+	years = startyear + hours / float(s.HOURS_IN_YEAR)
+
+	# emissions rise until ~1970 and then decline, as they did for PCBs.
+	emissions = np.exp(-((years - 1970.0) / 15.0) ** 2)
+	first_birth_year = startyear - age_at_model_start - s.HUMAN_MAX_AGE + s.DEFAULT_AGE_SPREAD
+
+	data = np.empty((len(hours), s.NUMBER_OF_HUMANS + 1))
+	data[:, 0] = hours
+	for i in range(s.NUMBER_OF_HUMANS):
+		column = s.NUMBER_OF_HUMANS - (i % s.NUMBER_OF_HUMANS)
+		age = np.mod(years - (first_birth_year + i * s.DEFAULT_AGE_SPREAD), s.HUMAN_MAX_AGE)
+		data[:, column] = 100.0 * emissions * (1.0 - np.exp(-age / 10.0)) + 0.5 * np.exp(-age) + 0.01 * rng.rand(len(hours))
+
+	name = 'Woman' if female else 'Man'
+	with open(filename, 'wb') as f:
+		if preamble:
+			f.write('"Human (%s) concentrations in ng/g fat"\r\n' % ('female' if female else 'male'))
+			f.write('"Date: ","1/1/2015 12:00:00 AM"\r\n""\r\n')
+			f.write('"Chemical: ","%s"\r\n"Region: ","Default Region"\r\n""\r\n' % chemical)
+		f.write(','.join(['"Time"'] + ['"%s %d"' % (name, i) for i in range(1, s.NUMBER_OF_HUMANS + 1)]) + '\r\n')
+		np.savetxt(f, data, fmt='%d' + ',"%.4g"' * s.NUMBER_OF_HUMANS, newline='\r\n')
+	return filename
+
+def write_nhanes_cycle(directory, nhanes_year='2003-2004', respondents=1000, food_records=10, missing_fraction=0.2, seed=0):
+	"""Write the component and dietary csv files of one NHANES cycle into directory.
+
+	The files get the names SWNhanesReader looks for, with the row name column,
+	SEQN column and upper case variable headers of the real exports.
+	"""
+	rng = np.random.RandomState(seed)
+	folder = os.path.join(directory, SWNhanesReader.folders_dict[nhanes_year])
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+
+	seqn = np.arange(21005, 21005 + respondents)
+	age = rng.randint(0, 86, respondents)
+	gender = rng.randint(1, 3, respondents)
+	diet_prefix = 'DR1' if nhanes_year == '2003-2004' else 'DRX'
+
+	for filename in SWNhanesReader.filenames_dict[nhanes_year]:
+		columns = _component_columns(filename, age, gender, diet_prefix, rng)
+		for header, values in columns:
+			if header not in (s.AGE_CODE, s.GENDER_CODE):
+				values[rng.rand(respondents) < missing_fraction] = np.nan # respondents who were not measured
+		_write_csv(os.path.join(folder, filename), seqn, columns)
+
+	# one row per food record, the food number is in the third column.
+	record_seqn = np.repeat(seqn, food_records)
+	record_number = np.tile(np.arange(1, food_records + 1), respondents)
+	columns = [
+		(diet_prefix + 'ILINE', record_number.astype(np.float64)),
+		(diet_prefix + 'IFDCD', rng.randint(11000000, 99999999, len(record_seqn)).astype(np.float64)),
+		(diet_prefix + 'IGRMS', np.round(rng.gamma(2.0, 60.0, len(record_seqn)), 2)),
+		(diet_prefix + 'IKCAL', np.round(rng.gamma(2.0, 100.0, len(record_seqn)))),
+	]
+	_write_csv(os.path.join(folder, SWNhanesReader.diet_filename_dict[nhanes_year]), record_seqn, columns)
+	return folder
+
+def _component_columns(filename, age, gender, diet_prefix, rng):
+	"""made up variables for each kind of component file"""
+	n = len(age)
+	name = filename.upper()
+	if name.startswith('DEMO'):
+		return [(s.GENDER_CODE, gender.astype(np.float64)), (s.AGE_CODE, age.astype(np.float64))]
+	if name.startswith('RHQ'):
+		births = rng.randint(0, s.NUMBER_MAX_BIRTH + 1, n).astype(np.float64)
+		return [(s.NUMBER_OF_BIRTHS_CODE, births), (s.AGE_FIRST_CHILD_CODE, rng.randint(16, 35, n).astype(np.float64)), (s.AGE_LAST_CHILD_CODE, rng.randint(25, 45, n).astype(np.float64))]
+	if name.startswith('BMX'):
+		return [(s.BMI_CODE, np.round(rng.normal(27.0, 5.0, n), 1))]
+	if name.startswith('DR'):
+		return [(diet_prefix + 'TKCAL', np.round(rng.gamma(4.0, 500.0, n))), (s.SHELLFISH_CODE, rng.randint(1, 3, n).astype(np.float64)), (s.FISH_CODE, rng.randint(1, 3, n).astype(np.float64))]
+	if 'DFP' in name:
+		return [('LBXD01LA', np.round(rng.lognormal(1.0, 0.8, n), 2)), ('LBXF01LA', np.round(rng.lognormal(0.5, 0.8, n), 2))]
+	# PCB lab file, lipid adjusted concentrations increase with age.
+	return [(code, np.round(rng.lognormal(0.0, 0.7, n) * (1 + age / 10.0), 3)) for code in PCB_CODES]
+
+def _write_csv(filename, seqn, columns):
+	with open(filename, 'wb') as f:
+		writer = csv.writer(f, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_NONNUMERIC)
+		writer.writerow([''] + ['SEQN'] + [header for header, values in columns])
+		for i, number in enumerate(seqn):
+			row = [str(i + 1), int(number)]
+			for header, values in columns:
+				row.append('' if np.isnan(values[i]) else _format(values[i]))
+			writer.writerow(row)
+
+def _format(value):
+	return int(value) if value == int(value) else float(value)